@@ -1,17 +1,47 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
-from sqlalchemy import func, extract
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, abort, stream_with_context
+from sqlalchemy import func
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
 from datetime import datetime
 import os
 from flask import send_file
 import io
-from fpdf import FPDF
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 
 # Importa as classes de banco de dados do arquivo models.py
-from models import db, User, Student, Guardian, Fee, Teacher, Class
+from models import db, User, Student, Guardian, Fee, Teacher, Class, StatementLine, ReminderLog
+from kpis import MESES_ORDEM, get_kpis, invalidate_kpis
+from migrations import upgrade_schema
+from commands import register_commands, ensure_admin
+from billing import generate_month_fees, generate_year_fees, count_students, is_duplicate_fee
+from rollup import ALL, refresh_rollup, refresh_fee, rebuild_rollup
+from receipts import receipt_data, receipt_filename, render_receipt, render_batch_pdf, stream_batch_zip, write_batch_pdf, write_batch_zip
+from instrumentation import init_instrumentation, timed_pdf, render_metrics
+from database import init_database, read_only
+from httpcache import init_http_cache, conditional, compressed
+from usercache import init_user_cache, user_cache, render_user_cache_metrics
+from jobs import init_jobs, submit_job, get_job, result_path
+from export import FEE_HEADER, STUDENT_HEADER, EXPORT_ROWS, XLSX_MIMETYPE, stream_csv, xlsx_available, write_xlsx_export
+from importer import import_school, STUDENT_COLUMNS, FEE_COLUMNS
+from search import search, index_students, index_guardians, remove_from_index, rebuild_search_index
+from utils import data_formulario
+from delinquency import BUCKETS, DELINQUENT_STUDENT_HEADER, DELINQUENT_GUARDIAN_HEADER, fetch_report, report_totals
+from reconciliation import CSV_COLUMNS as STATEMENT_COLUMNS, pay_fees, reconcile_statement
+from reminders import init_reminders, run_reminders_job, DAYS_AHEAD
+from charts import chart_data
+from ledger import PAGE_SIZE, ledger_query, fetch_page, fee_to_dict
 
+login_manager = LoginManager()
+login_manager.login_view = 'index'
+
+@login_manager.user_loader
+def load_user(user_id):
+    return user_cache.get(int(user_id))
+
+# Uma única instância do app, com as rotas abaixo. Importar este módulo só
+# configura: não conecta no banco. Tabelas e admin são criados pelos
+# comandos init-db / create-admin (ver commands.py).
 app = Flask(__name__)
 
 # --- CONFIGURAÇÕES ---
@@ -19,22 +49,27 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'chave-secreta-dev-local')
 
 # Conexão com Banco de Dados (SQLite local ou PostgreSQL no Render)
-db_url = os.environ.get('DATABASE_URL', 'sqlite:///escola.db')
-# Correção necessária para o Render/Heroku reconhecer o link do Postgres
-if db_url.startswith("postgres://"):
-    db_url = db_url.replace("postgres://", "postgresql://", 1)
-
-app.config['SQLALCHEMY_DATABASE_URI'] = db_url
+# Pool, timeouts e réplica de leitura: ver database.py
+init_database(app)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Cabeçalhos com contagem de consultas SQL e alerta de N+1 (ver instrumentation.py)
+app.config['QUERY_STATS'] = os.environ.get('QUERY_STATS') == '1'
+
+# Cache do usuário logado (segundos); 0 desliga (ver usercache.py)
+app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 60))
+
 db.init_app(app)
-login_manager = LoginManager()
+init_jobs(app)
+init_instrumentation(app)
+init_user_cache(app)
+init_http_cache(app)
+# Lembretes: REMINDER_SENDER (file/webhook), REMINDER_RATE... (ver reminders.py)
+init_reminders(app)
+# Botão XLSX só aparece com openpyxl instalado (ver export.py)
+app.jinja_env.globals['xlsx_available'] = xlsx_available()
 login_manager.init_app(app)
-login_manager.login_view = 'index'
-
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
+register_commands(app)
 
 # --- ROTAS ---
 
@@ -66,60 +101,59 @@ def logout():
 
 @app.route('/dashboard')
 @login_required
+@read_only
 def dashboard():
-    total_students = Student.query.count()
-    total_fees = Fee.query.filter_by(status='pago').count()
-    pending_fees = Fee.query.filter_by(status='pendente').count()
-    
-    # --- DADOS PARA GRÁFICO DE RECEITA MENSAL ---
-    # Lista de todos os meses
-    meses_ordem = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho', 'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
-    
-    # Calcula receita por mês
-    receitas_por_mes = []
-    for mes in meses_ordem:
-        # Soma todos os pagamentos daquele mês
-        valor = db.session.query(db.func.sum(Fee.amount)).filter(
-            Fee.month == mes, 
-            Fee.status == 'pago'
-        ).scalar()
-        # Se não houver dados, valor é 0
-        receitas_por_mes.append(valor if valor else 0)
-
-    # --- DADOS PARA GRÁFICO DE TURMAS ---
-    # Pega as turmas que existem e conta quantos alunos têm (baseado no campo class_name do aluno)
-    turmas_distintas = db.session.query(Student.class_name).distinct().all()
-    nomes_turmas = [t[0] for t in turmas_distintas]
-    
-    alunos_por_turma = []
-    for nome_turma in nomes_turmas:
-        total = Student.query.filter_by(class_name=nome_turma).count()
-        alunos_por_turma.append(total)
-
-    # KPIs Financeiros Totais
-    receita_total = sum(receitas_por_mes)
-    pendente_total = sum([f.amount for f in Fee.query.filter_by(status='pendente').all()])
-
-    return render_template('dashboard.html', 
-                           student_count=total_students, 
-                           paid=total_fees, 
-                           pending=pending_fees,
-                           receita_total=receita_total,
-                           pendente_total=pendente_total,
-                           meses=meses_ordem,
-                           valores_receita=receitas_por_mes,
-                           nomes_turmas=nomes_turmas,
-                           alunos_turma=alunos_por_turma
-                           )
+    # Todos os KPIs vêm de um snapshot em cache (ver kpis.py),
+    # recalculado com poucas consultas agrupadas apenas após escritas.
+    # Os gráficos são carregados depois pela página (/api/dashboard/charts).
+    return render_template('dashboard.html', **get_kpis())
+
+@app.route('/api/dashboard/charts')
+@login_required
+@read_only
+@conditional('fee_rollup', 'student', 'class')
+@compressed
+def api_dashboard_charts():
+    # Séries dos gráficos (ver charts.py); ?year=2025&class_id=3
+    return jsonify(chart_data(
+        year=request.args.get('year', type=int),
+        class_id=request.args.get('class_id', type=int),
+    ))
 
 @app.route('/students')
 @login_required
+@conditional('student', 'guardian', 'class')
 def students():
-    students = Student.query.all()
-    # Busca responsáveis e turmas para os Dropdowns
-    guardians = Guardian.query.all()
-    classes = Class.query.all()
-    return render_template('students.html', students=students, guardians=guardians, classes=classes)
+    # Responsável vem no mesmo SELECT (evita uma consulta por linha no template)
+    students = Student.query.options(joinedload(Student.guardian), joinedload(Student.school_class)) \
+        .order_by(Student.name).all()
+    # Turmas para o Dropdown (responsáveis são buscados por /api/search)
+    classes = Class.query.order_by(Class.year.desc(), Class.name).all()
+    return render_template('students.html', students=students, classes=classes,
+                           student_columns=STUDENT_COLUMNS, fee_columns=FEE_COLUMNS)
+
+@app.route('/students/export')
+@login_required
+def export_students():
+    class_id = request.args.get('class_id', type=int)
+    return export_response('alunos', STUDENT_HEADER, 'students', {'class_id': class_id})
+
+@app.route('/students/import', methods=['POST'])
+@login_required
+def import_students():
+    # Importação em massa de alunos/responsáveis/turmas (e mensalidades antigas)
+    students_file = request.files.get('students_file')
+    fees_file = request.files.get('fees_file')
+    if not students_file or not students_file.filename:
+        flash('Selecione o arquivo CSV de alunos.', 'error')
+        return redirect(url_for('students'))
+
+    report = import_school(students_file, fees_file if fees_file and fees_file.filename else None)
+    rebuild_search_index()
+    if report.fees:
+        rebuild_rollup()
+    invalidate_kpis()
+    return render_template('import_result.html', report=report)
 
 @app.route('/students/add', methods=['POST'])
 @login_required
@@ -135,18 +169,22 @@ def add_student():
         # Se digitou um nome novo, cria o responsável
         guardian = Guardian(name=new_guardian_name, phone='', relation='', cpf='')
         db.session.add(guardian)
-        db.session.commit()
+        db.session.flush()
+        index_guardians([guardian.id])
         student_guardian_id = guardian.id
     else:
         # Se selecionou no dropdown, usa o ID
         student_guardian_id = guardian_id if guardian_id else None
 
-    # Recebe o nome da turma (dropdown ou texto)
-    class_name = request.form.get('class_name')
+    # Recebe o ID da turma (dropdown)
+    class_id = request.form.get('class_id', type=int)
     
-    new_student = Student(name=name, birth_date=datetime.strptime(birth, '%Y-%m-%d'), class_name=class_name, guardian_id=student_guardian_id)
+    new_student = Student(name=name, birth_date=datetime.strptime(birth, '%Y-%m-%d'), class_id=class_id, guardian_id=student_guardian_id)
     db.session.add(new_student)
+    db.session.flush()
+    index_students([new_student.id])
     db.session.commit()
+    invalidate_kpis()
     
     flash(f'Aluno {name} cadastrado com sucesso!')
     return redirect(url_for('students'))
@@ -156,14 +194,22 @@ def add_student():
 def edit_student():
     student_id = request.form.get('id')
     student = Student.query.get_or_404(student_id)
+    old_class_id = student.class_id
     
     student.name = request.form.get('name')
     student.birth_date = datetime.strptime(request.form.get('birth'), '%Y-%m-%d')
-    student.class_name = request.form.get('class_name')
+    student.class_id = request.form.get('class_id', type=int)
     
     # Nota: Se quiser trocar o responsável no futuro, precisaria adicionar a lógica aqui também
     
+    db.session.flush()
+    index_students([student.id])
+    if student.class_id != old_class_id:
+        # As mensalidades do aluno mudam de turma no resumo financeiro
+        refresh_rollup(class_id=old_class_id)
+        refresh_rollup(class_id=student.class_id)
     db.session.commit()
+    invalidate_kpis()
     flash('Dados do aluno atualizados!')
     return redirect(url_for('students'))
     
@@ -174,7 +220,7 @@ def edit_student():
         db.session.add(guardian)
         db.session.commit()
     
-    new_student = Student(name=name, birth_date=datetime.strptime(birth, '%Y-%m-%d'), class_name=class_name, guardian_id=guardian.id)
+    new_student = Student(name=name, birth_date=datetime.strptime(birth, '%Y-%m-%d'), class_id=class_id, guardian_id=guardian.id)
     db.session.add(new_student)
     db.session.commit()
     
@@ -185,29 +231,135 @@ def edit_student():
 @login_required
 def delete_student(id):
     student = Student.query.get_or_404(id)
+    # As mensalidades do aluno saem junto (o extrato conciliado continua registrado)
+    fee_ids = db.session.query(Fee.id).filter(Fee.student_id == id)
+    StatementLine.query.filter(StatementLine.fee_id.in_(fee_ids)) \
+        .update({StatementLine.fee_id: None}, synchronize_session=False)
+    ReminderLog.query.filter(ReminderLog.fee_id.in_(fee_ids)).delete(synchronize_session=False)
+    Fee.query.filter_by(student_id=id).delete(synchronize_session=False)
     db.session.delete(student)
+    remove_from_index('student', [id])
+    refresh_rollup(class_id=student.class_id)
     db.session.commit()
+    invalidate_kpis()
     flash('Aluno removido.')
     return redirect(url_for('students'))
 
+def ledger_filters():
+    # Filtros comuns da tela financeira e da API (querystring)
+    return {
+        'status': request.args.get('status') or None,
+        'month': request.args.get('month') or None,
+        'year': request.args.get('year', type=int),
+        'class_id': request.args.get('class_id', type=int),
+        'student_id': request.args.get('student_id', type=int),
+    }
+
 @app.route('/finance')
 @login_required
+@read_only
 def finance():
-    fees = Fee.query.order_by(Fee.due_date.desc()).all()
-    students = Student.query.all() # Necessário para o modal de geração
-    return render_template('finance.html', fees=fees, students=students)
+    filters = ledger_filters()
+    fees, next_cursor = fetch_page(
+        ledger_query(**filters),
+        cursor=request.args.get('cursor'),
+        limit=request.args.get('limit', PAGE_SIZE, type=int)
+    )
+    # Alunos dos modais são buscados por /api/search (typeahead)
+    classes = Class.query.order_by(Class.year.desc(), Class.name).all()
+    return render_template('finance.html', fees=fees, filters=filters,
+                           next_cursor=next_cursor, classes=classes, meses=MESES_ORDEM,
+                           statement_columns=STATEMENT_COLUMNS)
+
+@app.route('/api/finance/fees')
+@login_required
+@read_only
+def api_finance_fees():
+    fees, next_cursor = fetch_page(
+        ledger_query(**ledger_filters()),
+        cursor=request.args.get('cursor'),
+        limit=request.args.get('limit', PAGE_SIZE, type=int)
+    )
+    return jsonify(items=[fee_to_dict(f) for f in fees], next_cursor=next_cursor)
+
+@app.route('/finance/export')
+@login_required
+def export_fees():
+    # Extrato completo (com os mesmos filtros da tela) em CSV ou XLSX
+    return export_response('mensalidades', FEE_HEADER, 'fees', ledger_filters())
+
+def export_response(name, header, kind, filters):
+    # kind: fonte em export.EXPORT_ROWS; filters: argumentos dela
+    if request.args.get('format') == 'xlsx':
+        if not xlsx_available():
+            flash('Exportação XLSX indisponível (instale o pacote openpyxl). Use CSV.', 'error')
+            return redirect(request.referrer or url_for('dashboard'))
+        # Planilha grande é montada no pool de processos, como os recibos em lote
+        job_id = submit_job('export', write_xlsx_export, (kind, header, filters), f'{name}.xlsx', XLSX_MIMETYPE)
+        return redirect(url_for('job_status', job_id=job_id))
+
+    # CSV enviado aos poucos enquanto o banco é lido em lotes
+    return Response(
+        stream_with_context(stream_csv(header, EXPORT_ROWS[kind](**filters))),
+        mimetype='text/csv; charset=utf-8',
+        headers={'Content-Disposition': f'attachment; filename={name}.csv'}
+    )
+
+def delinquency_filters():
+    return {
+        'by': 'guardian' if request.args.get('by') == 'guardian' else 'student',
+        'class_id': request.args.get('class_id', type=int),
+        'sort': request.args.get('sort') or 'total',
+        'order': request.args.get('order') or None,
+    }
+
+@app.route('/finance/delinquency')
+@login_required
+@read_only
+def delinquency():
+    # Inadimplência por aluno ou responsável, em faixas de atraso (ver delinquency.py)
+    filters = delinquency_filters()
+    page = request.args.get('page', 1, type=int)
+    rows, has_next = fetch_report(page=page, limit=request.args.get('limit', type=int), **filters)
+    totals = report_totals(filters['by'], filters['class_id'])
+    classes = Class.query.order_by(Class.year.desc(), Class.name).all()
+    return render_template('delinquency.html', rows=rows, totals=totals, filters=filters, page=page,
+                           has_next=has_next, buckets=BUCKETS, classes=classes)
+
+@app.route('/finance/delinquency/export')
+@login_required
+def export_delinquency():
+    filters = delinquency_filters()
+    header = DELINQUENT_GUARDIAN_HEADER if filters['by'] == 'guardian' else DELINQUENT_STUDENT_HEADER
+    return export_response(f'inadimplencia_{filters["by"]}', header, 'delinquency', filters)
 
 @app.route('/finance/add', methods=['POST'])
 @login_required
 def add_fee():
     student_id = request.form.get('student_id')
+    if not student_id:
+        flash('Selecione o aluno na lista de sugestões.', 'error')
+        return redirect(url_for('finance'))
     month = request.form.get('month')
     amount = float(request.form.get('amount'))
     due_date = request.form.get('due_date')
     
-    new_fee = Fee(student_id=student_id, month=month, amount=amount, due_date=datetime.strptime(due_date, '%Y-%m-%d'), status='pendente')
+    due_date = datetime.strptime(due_date, '%Y-%m-%d')
+    
+    new_fee = Fee(student_id=student_id, month=month, year=due_date.year, amount=amount, due_date=due_date, status='pendente')
     db.session.add(new_fee)
-    db.session.commit()
+    try:
+        db.session.flush()
+        refresh_fee(new_fee)
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        if not is_duplicate_fee(e):
+            raise
+        # Já existe mensalidade deste aluno para o mesmo mês/ano
+        flash(f'Já existe mensalidade de {month}/{due_date.year} para este aluno.', 'error')
+        return redirect(url_for('finance'))
+    invalidate_kpis()
     flash('Mensalidade gerada.')
     return redirect(url_for('finance'))
 
@@ -217,43 +369,77 @@ def pay_fee(id):
     fee = Fee.query.get_or_404(id)
     fee.status = 'pago'
     fee.payment_date = datetime.now()
+    refresh_fee(fee)
     db.session.commit()
+    invalidate_kpis()
     flash('Pagamento registrado com sucesso!')
     return redirect(url_for('finance'))
     # ... código anterior (pay_fee) ...
 
+@app.route('/finance/pay-bulk', methods=['POST'])
+@login_required
+def pay_fees_bulk():
+    # Baixa das mensalidades marcadas na tela, em UPDATEs em lote (ver reconciliation.py)
+    fee_ids = [int(i) for i in request.form.getlist('fee_ids') if i.isdigit()]
+    if not fee_ids:
+        flash('Marque as mensalidades que foram pagas.', 'error')
+        return redirect(request.referrer or url_for('finance'))
+    payment_date = request.form.get('payment_date')
+    if payment_date:
+        payment_date = data_formulario(payment_date)
+        if payment_date is None:
+            flash('Data de pagamento inválida.', 'error')
+            return redirect(request.referrer or url_for('finance'))
+    else:
+        payment_date = datetime.now().date()
+    paid_count, already_paid = pay_fees(fee_ids, payment_date)
+    if paid_count:
+        invalidate_kpis()
+    flash(f'{paid_count} pagamentos registrados ({already_paid} já estavam pagos).')
+    return redirect(request.referrer or url_for('finance'))
+
+@app.route('/finance/reconcile', methods=['POST'])
+@login_required
+def reconcile():
+    # Conciliação do extrato bancário (CSV ou OFX); pode ser enviado de novo sem pagar em dobro
+    statement = request.files.get('statement')
+    if not statement or not statement.filename:
+        flash('Selecione o extrato (CSV ou OFX).', 'error')
+        return redirect(url_for('finance'))
+    report = reconcile_statement(statement)
+    if report.paid:
+        invalidate_kpis()
+    return render_template('reconcile_result.html', report=report)
+
 @app.route('/finance/bulk', methods=['POST'])
 @login_required
 def bulk_fees():
     month = request.form.get('month')
-    year = request.form.get('year')
+    year = int(request.form.get('year') or datetime.now().year)
     base_value = float(request.form.get('amount'))
-    discount = float(request.form.get('discount', 0))
+    discount = float(request.form.get('discount') or 0)
+    class_id = request.form.get('class_id', type=int)
     
     final_amount = base_value - discount
     
     due_date_str = request.form.get('due_date')
-    due_date = datetime.strptime(due_date_str, '%Y-%m-%d') if due_date_str else None
-    
-    students = Student.query.all()
-    created_count = 0
-    
-    for s in students:
-        # Verifica se não existe mensalidade para este aluno neste mês
-        existing = Fee.query.filter_by(student_id=student.id, month=mes).filter(extract('year', Fee.due_date) == current_year).first()
-        if not existing:
-            new_fee = Fee(
-                student_id=s.id, 
-                month=month, 
-                amount=final_amount, 
-                due_date=due_date, 
-                status='pendente'
-            )
-            db.session.add(new_fee)
-            created_count += 1
-            
+    if due_date_str:
+        due_date = datetime.strptime(due_date_str, '%Y-%m-%d').date()
+    else:
+        # Sem data informada: vence no dia 10 do mês de referência
+        due_date = datetime(year, MONTHS_MAP[month], 10).date()
+    
+    # Um INSERT ... SELECT para todos os alunos sem mensalidade no mês (ver billing.py)
+    total_students = count_students(class_id=class_id)
+    created_count = generate_month_fees(month, year, final_amount, due_date, class_id=class_id)
+    if created_count:
+        refresh_rollup(year, month, class_id or ALL)
     db.session.commit()
-    flash(f'{created_count} mensalidades geradas para {month}!')
+    if created_count:
+        invalidate_kpis()
+    
+    skipped_count = total_students - created_count
+    flash(f'{created_count} mensalidades geradas para {month}/{year} ({skipped_count} já existiam)!')
     return redirect(url_for('finance'))
 
 @app.route('/finance/edit', methods=['POST'])
@@ -271,7 +457,9 @@ def edit_fee():
     else:
         fee.payment_date = None # Se voltar para pendente, apaga data pagamento
         
+    refresh_fee(fee)
     db.session.commit()
+    invalidate_kpis()
     flash('Mensalidade atualizada!')
     return redirect(url_for('finance'))
 
@@ -284,139 +472,198 @@ MONTHS_MAP = {
 @app.route('/finance/yearly', methods=['POST'])
 @login_required
 def generate_yearly_fees():
-    student_id = request.form.get('student_id')
+    # Escopo: um aluno (padrão), uma turma ou a escola inteira
+    scope = request.form.get('scope', 'student')
     base_value = float(request.form.get('amount'))
-    discount = float(request.form.get('discount', 0))
+    discount = float(request.form.get('discount') or 0)
     due_day = int(request.form.get('due_day'))
-    
-    student = Student.query.get_or_404(student_id)
-    current_year = datetime.now().year
+    current_year = int(request.form.get('year') or datetime.now().year)
     
     final_amount = base_value - discount
-    created_count = 0
-
-    for mes, num_mes in MONTHS_MAP.items():
-        # Tenta criar a data corretamente
-        try:
-            due_date = datetime(current_year, num_mes, due_day).date()
-        except ValueError:
-            due_date = datetime(current_year, num_mes, 28).date()
-
-        # --- NOVA LÓGICA BLINDADA ---
-        # Tenta criar a mensalidade direto. Se já existe, o banco vai reclamar (IntegrityError)
-        # e nós capturamos o erro e ignoramos. Assim evitamos o comando LIKE.
-        try:
-            new_fee = Fee(
-                student_id=student.id, 
-                month=mes, 
-                amount=final_amount, 
-                due_date=due_date, 
-                status='pendente'
-            )
-            db.session.add(new_fee)
-            db.session.commit()
-            created_count += 1
-        except IntegrityError:
-            # Se der erro de integridade (chave duplicada), significa que já existe.
-            # Fazemos um rollback para limpar o erro e continuamos o loop.
-            db.session.rollback()
-        # -----------------------------
-
-    flash(f'{created_count} mensalidades geradas para {student.name}!')
+    
+    student_id = None
+    class_id = None
+    if scope == 'class':
+        turma = db.session.get(Class, request.form.get('class_id', type=int) or 0)
+        if not turma:
+            flash('Selecione a turma.', 'error')
+            return redirect(url_for('finance'))
+        class_id = turma.id
+        target = f'a turma {turma.label}'
+    elif scope == 'school':
+        target = 'todos os alunos'
+    else:
+        if not request.form.get('student_id'):
+            flash('Selecione o aluno na lista de sugestões.', 'error')
+            return redirect(url_for('finance'))
+        student = Student.query.get_or_404(request.form.get('student_id'))
+        student_id = student.id
+        target = student.name
+
+    # Todas as 12 parcelas em uma única transação; duplicadas são ignoradas pelo banco
+    created_count = generate_year_fees(current_year, final_amount, due_day,
+                                       class_id=class_id, student_id=student_id)
+    if created_count:
+        # Só o ano gerado (da turma do aluno ou da turma escolhida) é recalculado
+        refresh_class = student.class_id if student_id else class_id
+        refresh_rollup(current_year, class_id=refresh_class if scope != 'school' else ALL)
+    db.session.commit()
+    if created_count:
+        invalidate_kpis()
+
+    flash(f'{created_count} mensalidades geradas para {target}!')
     return redirect(url_for('finance'))    
 
 @app.route('/finance/receipt/<int:id>')
 @login_required
 def generate_receipt(id):
     fee = Fee.query.get_or_404(id)
-    student = fee.student
-    
-    # 1. Segurança: Verifica se o aluno e responsável existem
-    guardian_name = "Não informado"
-    if student and student.guardian:
-        guardian_name = student.guardian.name
-
-    # 2. Segurança: Verifica se a data de pagamento existe
-    pay_date_str = "N/D"
-    if fee.payment_date:
-        pay_date_str = fee.payment_date.strftime('%d/%m/%Y')
-
-    # Função auxiliar para remover acentos (com segurança)
-    def remover_acentos(txt):
-        if not txt: return ""
-        try:
-            return unicodedata.normalize('NFKD', txt).encode('ASCII', 'ignore').decode('ASCII')
-        except:
-            return txt
-
-    pdf = FPDF()
-    pdf.add_page()
-    
-    # Cabeçalho
-    pdf.set_font('Arial', 'B', 16)
-    pdf.cell(200, 10, remover_acentos('Escola Renascer'), ln=True, align='C')
-    
-    pdf.set_font('Arial', 'I', 12)
-    pdf.cell(200, 6, remover_acentos('Comprovante de Pagamento'), ln=True, align='C')
-    pdf.ln(10)
-    
-    pdf.set_draw_color(200, 200, 200)
-    pdf.line(10, 40, 200, 40)
-    pdf.ln(10)
-    
-    # Dados do Recibo
-    pdf.set_font('Arial', '', 12)
-    pdf.cell(200, 8, f'ID do Pagamento: #{fee.id}', ln=True)
-    pdf.cell(200, 8, f'Data de Emissao: {datetime.now().strftime("%d/%m/%Y")}', ln=True)
-    pdf.cell(200, 8, f'Data do Pagamento: {pay_date_str}', ln=True)
-    pdf.ln(5)
-    
-    pdf.set_font('Arial', 'B', 12)
-    pdf.cell(40, 8, remover_acentos('Aluno(a):'), ln=False)
-    pdf.set_font('Arial', '', 12)
-    pdf.cell(160, 8, remover_acentos(student.name), ln=True)
-    
-    pdf.set_font('Arial', 'B', 12)
-    pdf.cell(40, 8, remover_acentos('Responsavel:'), ln=False)
-    pdf.set_font('Arial', '', 12)
-    pdf.cell(160, 8, remover_acentos(guardian_name), ln=True)
-    
-    pdf.ln(10)
-    pdf.set_font('Arial', 'B', 12)
-    pdf.cell(40, 8, remover_acentos('Referencia:'), ln=False)
-    pdf.set_font('Arial', '', 12)
-    pdf.cell(160, 8, remover_acentos(fee.month), ln=True)
-    
-    pdf.set_font('Arial', 'B', 12)
-    pdf.cell(40, 8, remover_acentos('Valor Pago:'), ln=False)
-    pdf.set_font('Arial', '', 12)
-    pdf.cell(160, 8, f'R$ {fee.amount:.2f}', ln=True)
-    
-    pdf.ln(40)
-    pdf.line(60, 200, 150, 200)
-    pdf.set_font('Arial', 'I', 10)
-    pdf.cell(200, 8, remover_acentos('Assinatura da Direcao'), ln=True, align='C')
-    pdf.set_font('Arial', '', 8)
-    pdf.cell(200, 8, remover_acentos('Documento emitido eletronicamente.'), ln=True, align='C')
-
-    # --- CORREÇÃO DEFINITIVA ---
-    # O output() já retorna um bytearray (binário), então passamos direto pro buffer
-    pdf_bytes = pdf.output(dest='S')
-    buffer = io.BytesIO(pdf_bytes)
-    buffer.seek(0)
-    # --------------------------
+    data = receipt_data(fee)
+
+    # Recibos iguais (mesmos dados) saem do cache sem renderizar de novo
+    with timed_pdf('receipt'):
+        buffer = io.BytesIO(render_receipt(data))
 
     return send_file(
         buffer, 
         as_attachment=True, 
-        download_name=f'recibo_{fee.month}_{student.name}.pdf',
+        download_name=receipt_filename(data),
+        mimetype='application/pdf'
+    )
+
+def receipt_batch_items(args):
+    # Recibos em lote: mesmos filtros do extrato + intervalo de data de pagamento
+    query = ledger_query(
+        status='pago',
+        month=args.get('month') or None,
+        year=args.get('year', type=int),
+        class_id=args.get('class_id', type=int),
+    )
+
+    # Datas vêm da URL/formulário: inválidas viram ValueError (quem chama avisa)
+    start = data_formulario(args.get('start')) if args.get('start') else None
+    end = data_formulario(args.get('end')) if args.get('end') else None
+    if (args.get('start') and not start) or (args.get('end') and not end):
+        raise ValueError('Intervalo de pagamento com data inválida.')
+    if start:
+        query = query.filter(Fee.payment_date >= start)
+    if end:
+        query = query.filter(Fee.payment_date <= end)
+
+    return [receipt_data(f) for f in query.order_by(Fee.payment_date, Fee.id)]
+
+@app.route('/finance/receipts')
+@login_required
+def batch_receipts():
+    try:
+        items = receipt_batch_items(request.args)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('finance'))
+    if not items:
+        flash('Nenhum pagamento encontrado para os filtros escolhidos.', 'error')
+        return redirect(url_for('finance'))
+
+    if request.args.get('format') == 'zip':
+        return Response(
+            stream_batch_zip(items),
+            mimetype='application/zip',
+            headers={'Content-Disposition': 'attachment; filename=recibos.zip'}
+        )
+
+    with timed_pdf('receipt_batch'):
+        pdf_bytes = render_batch_pdf(items)
+    return send_file(
+        io.BytesIO(pdf_bytes),
+        as_attachment=True,
+        download_name='recibos.pdf',
         mimetype='application/pdf'
     )
 
+# --- TAREFAS EM SEGUNDO PLANO ---
+
+@app.route('/jobs/receipts', methods=['POST'])
+@login_required
+def receipts_job():
+    # Mesmo lote de /finance/receipts, mas renderizado no pool de processos
+    try:
+        items = receipt_batch_items(request.form)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('finance'))
+    if not items:
+        flash('Nenhum pagamento encontrado para os filtros escolhidos.', 'error')
+        return redirect(url_for('finance'))
+
+    if request.form.get('format') == 'zip':
+        job_id = submit_job('receipts', write_batch_zip, (items,), 'recibos.zip', 'application/zip')
+    else:
+        job_id = submit_job('receipts', write_batch_pdf, (items,), 'recibos.pdf', 'application/pdf')
+    return redirect(url_for('job_status', job_id=job_id))
+
+@app.route('/reminders/send', methods=['POST'])
+@login_required
+def send_reminders_job():
+    # Envio dos lembretes (milhares de responsáveis) roda no pool de processos
+    if current_user.role != 'director':
+        abort(403)
+    days_ahead = request.form.get('days_ahead', DAYS_AHEAD, type=int)
+    job_id = submit_job('reminders', run_reminders_job, (days_ahead,), 'lembretes.json', 'application/json')
+    return redirect(url_for('job_status', job_id=job_id))
+
+@app.route('/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    job = get_job(job_id)
+    if not job:
+        abort(404)
+    return render_template('job.html', job=job)
+
+@app.route('/api/jobs/<job_id>')
+@login_required
+def api_job_status(job_id):
+    job = get_job(job_id)
+    if not job:
+        abort(404)
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/download')
+@login_required
+def job_download(job_id):
+    job = get_job(job_id)
+    if not job or job['status'] != 'done':
+        abort(404)
+    return send_file(result_path(job_id), as_attachment=True,
+                     download_name=job['filename'], mimetype=job['mimetype'])
+
+# --- BUSCA ---
+
+@app.route('/api/search')
+@login_required
+def api_search():
+    # Typeahead de alunos/responsáveis: nome, responsável, CPF, telefone ou turma
+    results = search(
+        request.args.get('q', ''),
+        kind=request.args.get('kind') or None,
+        limit=request.args.get('limit', type=int)
+    )
+    return jsonify(results=results)
+
+# --- MÉTRICAS (Prometheus) ---
+
+@app.route('/metrics')
+@login_required
+def metrics():
+    # Latência, consultas SQL e tempos de renderização (ver instrumentation.py)
+    if current_user.role != 'director':
+        abort(403)
+    return Response(render_metrics() + render_user_cache_metrics(), mimetype='text/plain; version=0.0.4')
+
 # --- CRUD PROFESSORES ---
 
 @app.route('/teachers')
 @login_required
+@conditional('teacher')
 def teachers():
     teachers = Teacher.query.all()
     return render_template('teachers.html', teachers=teachers)
@@ -466,10 +713,13 @@ def delete_teacher(id):
 
 @app.route('/classes')
 @login_required
+@conditional('class', 'teacher', 'student')
 def classes_list():
-    classes = Class.query.order_by(Class.year.desc(), Class.name).all()
+    classes = Class.query.options(joinedload(Class.teacher)).order_by(Class.year.desc(), Class.name).all()
+    # Alunos por turma: uma consulta agrupada pelo índice ix_student_class_id
+    student_counts = dict(db.session.query(Student.class_id, func.count(Student.id)).group_by(Student.class_id))
     teachers = Teacher.query.all() # Para o select box
-    return render_template('classes.html', classes=classes, teachers=teachers)
+    return render_template('classes.html', classes=classes, teachers=teachers, student_counts=student_counts)
 
 @app.route('/classes/add', methods=['POST'])
 @login_required
@@ -489,11 +739,15 @@ def add_class():
 def edit_class():
     class_id = request.form.get('id')
     turma = Class.query.get_or_404(class_id)
+    old_label = (turma.name, turma.year)
     
     turma.name = request.form.get('name')
     turma.year = int(request.form.get('year'))
     turma.teacher_id = request.form.get('teacher_id') if request.form.get('teacher_id') else None
     
+    if (turma.name, turma.year) != old_label:
+        # Nome e ano da turma aparecem na busca de alunos
+        index_students(db.session.scalars(db.select(Student.id).where(Student.class_id == turma.id)).all())
     db.session.commit()
     flash('Turma atualizada!')
     return redirect(url_for('classes_list'))
@@ -506,32 +760,25 @@ def delete_class(id):
         return redirect(url_for('classes_list'))
         
     turma = Class.query.get_or_404(id)
+    # Os alunos ficam sem turma (e as mensalidades deles também, no resumo)
+    student_ids = db.session.scalars(db.select(Student.id).where(Student.class_id == id)).all()
+    Student.query.filter(Student.class_id == id).update({Student.class_id: None}, synchronize_session=False)
     db.session.delete(turma)
+    if student_ids:
+        index_students(student_ids)
+        refresh_rollup(class_id=id)
+        refresh_rollup(class_id=None)
     db.session.commit()
+    invalidate_kpis()
     flash('Turma removida.')
     return redirect(url_for('classes_list'))
 
-# --- INICIALIZAÇÃO DO BANCO DE DADOS ---
-# Este bloco garante que as tabelas sejam criadas assim que o app rodar
-# Tanto no seu PC quanto no Render.
-
-with app.app_context():
-    db.create_all()
-    # Cria o Admin se não existir
-# ... Dentro do bloco with app.app_context(): ...
-
-    if not User.query.filter_by(username='admin').first():
-        # ADICIONE 'method="pbkdf2:sha256"' conforme abaixo para encurtar a senha:
-        admin = User(
-            username='admin', 
-            password=generate_password_hash('123', method='pbkdf2:sha256'), 
-            role='director'
-        )
-        db.session.add(admin)
-        db.session.commit()
-        print("Usuário Admin criado automaticamente: admin / 123")
-
 if __name__ == '__main__':
+    # Execução local: prepara o banco e o admin antes de subir (no Render: Procfile)
+    with app.app_context():
+        upgrade_schema()
+        if ensure_admin('admin', '123'):
+            print("Usuário Admin criado automaticamente: admin / 123")
     # Lê a porta definida pelo Render, se não houver usa 5000
     port = int(os.environ.get("PORT", 5000))
     app.run(debug=True, host='0.0.0.0', port=port)
\ No newline at end of file
@@ -0,0 +1,275 @@
+"""Benchmark do EduAxis com dados sintéticos.
+
+Cria um banco SQLite temporário, popula com alunos, responsáveis, professores,
+turmas e alguns anos de mensalidades, e mede latência e número de consultas
+SQL das principais rotas pelo test client do Flask, além do tempo de boot
+(importar o app num processo novo).
+
+    python benchmark.py --students 5000 --years 3 --output bench.json
+    python benchmark.py --output novo.json --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+
+
+# Importar app.py não pode conectar no banco nem carregar módulos pesados
+# (fpdf, openpyxl): cada worker do gunicorn paga esse tempo no boot.
+STARTUP_TARGET_MS = 1000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark das rotas do EduAxis')
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--guardians', type=int, default=None, help='padrão: 80%% dos alunos')
+    parser.add_argument('--teachers', type=int, default=30)
+    parser.add_argument('--classes', type=int, default=20)
+    parser.add_argument('--years', type=int, default=3, help='anos de mensalidades')
+    parser.add_argument('--repeat', type=int, default=5, help='execuções por rota')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=None, help='arquivo JSON do relatório')
+    parser.add_argument('--compare', default=None, help='relatório anterior para comparar')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='regressão quando a mediana cresce mais que este fator')
+    parser.add_argument('--startup-target', type=float, default=STARTUP_TARGET_MS,
+                        help='tempo máximo (ms) para importar o app num processo novo')
+    return parser.parse_args()
+
+
+# --- DADOS SINTÉTICOS ---
+
+FIRST_NAMES = ['Ana', 'Bruno', 'Carla', 'Daniel', 'Eduarda', 'Felipe', 'Gabriela', 'Heitor',
+               'Isabela', 'João', 'Larissa', 'Miguel', 'Natália', 'Otávio', 'Paula', 'Rafael']
+LAST_NAMES = ['Silva', 'Santos', 'Oliveira', 'Souza', 'Lima', 'Pereira', 'Costa', 'Rodrigues',
+              'Almeida', 'Nascimento', 'Araújo', 'Gonçalves']
+
+
+def seed_database(db, models, args, rng):
+    from sqlalchemy import insert
+    from kpis import MESES_ORDEM
+
+    User, Guardian, Student, Fee, Teacher, Class = models
+    n_guardians = args.guardians or max(1, int(args.students * 0.8))
+
+    def name():
+        return f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)}'
+
+    db.session.execute(insert(Teacher), [
+        {'name': name(), 'subject': rng.choice(['Português', 'Matemática', 'Artes']), 'phone': ''}
+        for _ in range(args.teachers)
+    ])
+    this_year = datetime.now().year
+    db.session.execute(insert(Class), [
+        {'name': f'Turma {i + 1}', 'year': this_year, 'teacher_id': rng.randint(1, args.teachers)}
+        for i in range(args.classes)
+    ])
+    db.session.execute(insert(Guardian), [
+        {'name': name(), 'cpf': f'{rng.randint(0, 99999999999):011d}',
+         'phone': f'119{rng.randint(0, 99999999):08d}', 'relation': 'Mãe'}
+        for _ in range(n_guardians)
+    ])
+    db.session.execute(insert(Student), [
+        {'name': name(), 'birth_date': date(rng.randint(2010, 2020), rng.randint(1, 12), rng.randint(1, 28)),
+         'class_id': rng.randint(1, args.classes), 'guardian_id': rng.randint(1, n_guardians)}
+        for _ in range(args.students)
+    ])
+
+    # Mensalidades: anos anteriores pagos, ano atual parcialmente
+    fees = []
+    for year in range(this_year - args.years + 1, this_year + 1):
+        for month_number, month in enumerate(MESES_ORDEM, start=1):
+            due = date(year, month_number, 10)
+            for student_id in range(1, args.students + 1):
+                paid = due < date.today() and rng.random() < 0.9
+                fees.append({
+                    'student_id': student_id, 'month': month, 'year': year, 'amount': 500.0,
+                    'status': 'pago' if paid else 'pendente', 'due_date': due,
+                    'payment_date': due if paid else None,
+                })
+    for i in range(0, len(fees), 10000):
+        db.session.execute(insert(Fee), fees[i:i + 10000])
+    db.session.commit()
+
+    from rollup import rebuild_rollup
+    rebuild_rollup()
+    return len(fees)
+
+
+# --- MEDIÇÃO ---
+
+def measure(client, method, url, repeat, data=None, before=None):
+    timings = []
+    queries = []
+    for i in range(repeat):
+        if before:
+            before()
+        payload = data(i) if callable(data) else data
+        start = time.perf_counter()
+        response = client.open(url, method=method, data=payload)
+        timings.append((time.perf_counter() - start) * 1000)
+        if response.status_code >= 400:
+            raise RuntimeError(f'{method} {url} respondeu {response.status_code}')
+        queries.append(int(response.headers.get('X-Query-Count', 0)))
+    timings.sort()
+    return {
+        'runs': repeat,
+        'median_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        'min_ms': round(timings[0], 3),
+        'max_ms': round(timings[-1], 3),
+        'queries': max(queries),
+    }
+
+
+STARTUP_SCRIPT = (
+    'import time; start = time.perf_counter(); import app; '
+    'print((time.perf_counter() - start) * 1000)'
+)
+
+
+def measure_startup(repeat):
+    # Processo Python novo a cada vez, como o boot de um worker
+    here = os.path.dirname(os.path.abspath(__file__))
+    timings = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], cwd=here, env=os.environ,
+                             capture_output=True, text=True, check=True).stdout
+        timings.append(float(out.strip().splitlines()[-1]))
+    timings.sort()
+    return {
+        'runs': repeat,
+        'median_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        'min_ms': round(timings[0], 3),
+        'max_ms': round(timings[-1], 3),
+        'queries': 0,
+    }
+
+
+def run_benchmarks(app_module, args):
+    from kpis import invalidate_kpis
+    from models import Fee
+
+    app = app_module.app
+    client = app.test_client()
+    response = client.post('/login', data={'username': 'admin', 'password': '123'})
+    if response.status_code != 302:
+        raise RuntimeError('login do admin falhou')
+
+    with app.app_context():
+        paid_fee = Fee.query.filter_by(status='pago').first()
+        paid_fee_id = paid_fee.id if paid_fee else 1
+
+    far_year = datetime.now().year + 10
+    r = args.repeat
+    results = {}
+    results['dashboard_cold'] = measure(client, 'GET', '/dashboard', r, before=invalidate_kpis)
+    results['dashboard_cached'] = measure(client, 'GET', '/dashboard', r)
+    results['finance'] = measure(client, 'GET', '/finance', r)
+    results['students'] = measure(client, 'GET', '/students', r)
+    results['generate_receipt'] = measure(client, 'GET', f'/finance/receipt/{paid_fee_id}', r)
+    # Cada execução gera um mês/ano novo para que sempre haja inserção de verdade
+    results['bulk_fees'] = measure(client, 'POST', '/finance/bulk', r, data=lambda i: {
+        'month': 'Janeiro', 'year': str(far_year + i), 'amount': '500', 'discount': '0',
+    })
+    results['generate_yearly_fees'] = measure(client, 'POST', '/finance/yearly', r, data=lambda i: {
+        'scope': 'student', 'student_id': '1', 'year': str(far_year + r + i),
+        'amount': '500', 'discount': '0', 'due_day': '10',
+    })
+    return results
+
+
+def compare(current, previous_path, threshold):
+    with open(previous_path) as f:
+        previous = json.load(f)['results']
+
+    regressions = []
+    print(f'\n{"rota":<24}{"antes (ms)":>12}{"agora (ms)":>12}{"fator":>8}{"consultas":>14}')
+    for name, now in current.items():
+        before = previous.get(name)
+        if not before:
+            continue
+        factor = now['median_ms'] / before['median_ms'] if before['median_ms'] else 1.0
+        more_queries = now['queries'] > before['queries']
+        flag = ' <-- REGRESSÃO' if factor > threshold or more_queries else ''
+        print(f'{name:<24}{before["median_ms"]:>12.2f}{now["median_ms"]:>12.2f}{factor:>8.2f}'
+              f'{before["queries"]:>7} -> {now["queries"]:<4}{flag}')
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+
+    # Precisa ser definido antes de importar o app (a configuração é lida no import)
+    db_path = os.path.join(tempfile.mkdtemp(prefix='eduaxis-bench-'), 'bench.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['QUERY_STATS'] = '1'
+
+    import app as app_module
+    from models import db, User, Guardian, Student, Fee, Teacher, Class
+    from migrations import upgrade_schema
+    from commands import ensure_admin
+
+    with app_module.app.app_context():
+        upgrade_schema()
+        ensure_admin('admin', '123')
+        start = time.perf_counter()
+        total_fees = seed_database(db, (User, Guardian, Student, Fee, Teacher, Class), args, rng)
+        print(f'Banco populado em {time.perf_counter() - start:.1f}s: '
+              f'{args.students} alunos, {total_fees} mensalidades')
+
+    results = {'startup': measure_startup(args.repeat)}
+    results.update(run_benchmarks(app_module, args))
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'students': args.students,
+            'teachers': args.teachers,
+            'classes': args.classes,
+            'years': args.years,
+            'fees': total_fees,
+            'repeat': args.repeat,
+            'seed': args.seed,
+            'startup_target_ms': args.startup_target,
+        },
+        'results': results,
+    }
+
+    for name, r in results.items():
+        print(f'{name:<24} mediana {r["median_ms"]:>9.2f} ms  p95 {r["p95_ms"]:>9.2f} ms  {r["queries"]:>4} consultas')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Relatório salvo em {args.output}')
+
+    status = 0
+    if results['startup']['median_ms'] > args.startup_target:
+        print(f'\nBoot acima da meta: {results["startup"]["median_ms"]:.0f} ms (meta {args.startup_target:.0f} ms)')
+        status = 1
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print(f'\nRegressões: {", ".join(regressions)}')
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+from datetime import date
+from sqlalchemy import select, literal, exists, and_, func, insert as generic_insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, Student, Fee
+from kpis import MESES_ORDEM
+
+# --- GERAÇÃO DE MENSALIDADES EM LOTE ---
+# Em vez de um SELECT + INSERT por aluno, um único INSERT ... SELECT
+# escolhe no banco os alunos que ainda não têm mensalidade no mês/ano
+# (anti-join) e insere todos de uma vez. O índice único
+# (student_id, month, year) garante que corridas concorrentes não duplicam.
+
+
+def students_filter(class_id=None, student_id=None):
+    conditions = []
+    if class_id:
+        conditions.append(Student.class_id == class_id)
+    if student_id:
+        conditions.append(Student.id == student_id)
+    return conditions
+
+
+FEE_KEY = ['student_id', 'month', 'year']
+
+
+def fee_insert():
+    # INSERT em Fee que ignora linhas já existentes (mesmo aluno/mês/ano)
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        return pg_insert(Fee).on_conflict_do_nothing(index_elements=FEE_KEY)
+    if dialect == 'sqlite':
+        return sqlite_insert(Fee).on_conflict_do_nothing(index_elements=FEE_KEY)
+    # Outros bancos: quem chama precisa evitar as duplicatas (ex.: anti-join)
+    return generic_insert(Fee)
+
+
+def is_duplicate_fee(error):
+    # IntegrityError do índice único aluno/mês/ano (PostgreSQL cita o nome do
+    # índice; o SQLite, as colunas)
+    message = str(error.orig)
+    return 'uq_fee_student_month_year' in message or 'fee.student_id, fee.month, fee.year' in message
+
+
+def insert_ignoring_duplicates(column_names, source):
+    return db.session.execute(fee_insert().from_select(column_names, source)).rowcount
+
+
+def generate_month_fees(month, year, amount, due_date, class_id=None, student_id=None):
+    # Não faz commit: quem chama decide a transação (ver generate_year_fees)
+    already_billed = exists().where(and_(
+        Fee.student_id == Student.id,
+        Fee.month == month,
+        Fee.year == year,
+    ))
+    source = select(
+        Student.id,
+        literal(month),
+        literal(year),
+        literal(amount),
+        literal(due_date),
+        literal('pendente'),
+    ).where(~already_billed, *students_filter(class_id, student_id))
+
+    columns = ['student_id', 'month', 'year', 'amount', 'due_date', 'status']
+    return insert_ignoring_duplicates(columns, source)
+
+
+def count_students(class_id=None, student_id=None):
+    return db.session.query(func.count(Student.id)) \
+        .filter(*students_filter(class_id, student_id)).scalar()
+
+
+def due_date_for(year, month_number, due_day):
+    # Meses curtos (ex.: dia 30 em fevereiro) caem no dia 28
+    try:
+        return date(year, month_number, due_day)
+    except ValueError:
+        return date(year, month_number, 28)
+
+
+def generate_year_fees(year, amount, due_day, class_id=None, student_id=None):
+    # 12 INSERT ... SELECT (um por mês) na mesma transação, para um aluno,
+    # uma turma ou a escola inteira. O commit fica com quem chama.
+    created = 0
+    for month_number, month in enumerate(MESES_ORDEM, start=1):
+        created += generate_month_fees(
+            month, year, amount, due_date_for(year, month_number, due_day),
+            class_id=class_id, student_id=student_id
+        )
+    return created
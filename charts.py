@@ -0,0 +1,81 @@
+from datetime import date
+from sqlalchemy import func
+
+from models import db, Student, Class, FeeRollup
+from kpis import MESES_ORDEM
+
+# --- SÉRIES DOS GRÁFICOS (API JSON DO DASHBOARD) ---
+# O dashboard carrega só os cartões de KPI e busca os gráficos depois em
+# /api/dashboard/charts?year=&class_id=. Tudo sai do resumo FeeRollup (ver
+# rollup.py) e da contagem de alunos por turma (índice ix_student_class_id):
+# poucas consultas agrupadas.
+
+
+def available_years():
+    # Anos com mensalidades, do mais recente para o mais antigo (0 = sem ano)
+    years = db.session.query(FeeRollup.year).filter(FeeRollup.year != 0) \
+        .distinct().order_by(FeeRollup.year.desc())
+    return [year for year, in years]
+
+
+def rollup_filter(query, class_id):
+    if class_id is not None:
+        query = query.filter(FeeRollup.class_id == class_id)
+    return query
+
+
+def monthly_series(year, class_id=None):
+    # Por mês do ano: valor pago, valor pendente e taxa de pagamento (%)
+    rows = rollup_filter(
+        db.session.query(FeeRollup.month, FeeRollup.status, func.sum(FeeRollup.count), func.sum(FeeRollup.total))
+        .filter(FeeRollup.year == year), class_id
+    ).group_by(FeeRollup.month, FeeRollup.status)
+
+    counts, totals = {}, {}
+    for month, status, count, total in rows:
+        counts[month, status] = count or 0
+        totals[month, status] = total or 0
+
+    paid, pending, rate = [], [], []
+    for month in MESES_ORDEM:
+        paid.append(round(totals.get((month, 'pago'), 0), 2))
+        pending.append(round(totals.get((month, 'pendente'), 0), 2))
+        billed = counts.get((month, 'pago'), 0) + counts.get((month, 'pendente'), 0)
+        rate.append(round(100.0 * counts.get((month, 'pago'), 0) / billed, 1) if billed else None)
+    return {'paid': paid, 'pending': pending, 'payment_rate': rate}
+
+
+def yearly_revenue(class_id=None):
+    rows = rollup_filter(
+        db.session.query(FeeRollup.year, func.sum(FeeRollup.total))
+        .filter(FeeRollup.status == 'pago', FeeRollup.year != 0), class_id
+    ).group_by(FeeRollup.year).order_by(FeeRollup.year)
+    return {'years': [year for year, _ in rows], 'values': [round(total or 0, 2) for _, total in rows]}
+
+
+def class_sizes():
+    # Todas as turmas (mesmo vazias) com o número de alunos, numa consulta
+    turmas = db.session.query(Class.id, Class.name, Class.year, func.count(Student.id)) \
+        .outerjoin(Student, Student.class_id == Class.id) \
+        .group_by(Class.id, Class.name, Class.year) \
+        .order_by(Class.year.desc(), Class.name).all()
+    sem_turma = db.session.query(func.count(Student.id)).filter(Student.class_id.is_(None)).scalar()
+    return {
+        'ids': [c_id for c_id, _, _, _ in turmas],
+        'labels': [f'{name} ({year})' for _, name, year, _ in turmas],
+        'values': [total for _, _, _, total in turmas],
+        'unassigned': sem_turma or 0,
+    }
+
+
+def chart_data(year=None, class_id=None):
+    year = year or date.today().year
+    return {
+        'year': year,
+        'class_id': class_id,
+        'years': available_years(),
+        'months': list(MESES_ORDEM),
+        'monthly': monthly_series(year, class_id),
+        'yearly': yearly_revenue(class_id),
+        'classes': class_sizes(),
+    }
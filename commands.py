@@ -0,0 +1,68 @@
+import os
+import click
+from werkzeug.security import generate_password_hash
+
+from models import db, User
+from migrations import upgrade_schema
+from rollup import rebuild_rollup
+from kpis import invalidate_kpis
+from reminders import send_reminders, DAYS_AHEAD
+
+# --- COMANDOS (flask --app app <comando>) ---
+# Criação/atualização do banco e do admin saíram do import do app.py: rodam
+# uma vez por deploy, antes do gunicorn subir os workers (ver Procfile).
+#
+#   flask --app app init-db         cria tabelas, colunas, índices, busca e resumo
+#   flask --app app create-admin    cria o usuário diretor se ainda não existir
+#   flask --app app rebuild-rollup  recalcula o resumo financeiro
+#   flask --app app send-reminders  envia lembretes de mensalidade (ver reminders.py)
+
+
+def ensure_admin(username, password):
+    if User.query.filter_by(username=username).first():
+        return False
+    # ADICIONE 'method="pbkdf2:sha256"' conforme abaixo para encurtar a senha:
+    admin = User(
+        username=username,
+        password=generate_password_hash(password, method='pbkdf2:sha256'),
+        role='director'
+    )
+    db.session.add(admin)
+    db.session.commit()
+    return True
+
+
+def register_commands(app):
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Cria as tabelas e aplica colunas/índices que faltarem."""
+        upgrade_schema()
+        print('Banco de dados atualizado.')
+
+    @app.cli.command('create-admin')
+    @click.option('--username', default=lambda: os.environ.get('ADMIN_USERNAME', 'admin'))
+    @click.option('--password', default=lambda: os.environ.get('ADMIN_PASSWORD', '123'))
+    def create_admin_command(username, password):
+        """Cria o usuário diretor (ADMIN_USERNAME / ADMIN_PASSWORD) se não existir."""
+        if ensure_admin(username, password):
+            print(f'Usuário Admin criado: {username}')
+        else:
+            print(f'Usuário {username} já existe.')
+
+    @app.cli.command('rebuild-rollup')
+    def rebuild_rollup_command():
+        """Recalcula o resumo financeiro (FeeRollup) a partir das mensalidades."""
+        rebuild_rollup()
+        invalidate_kpis()
+        print('Resumo financeiro recalculado.')
+
+    @app.cli.command('send-reminders')
+    @click.option('--days-ahead', default=DAYS_AHEAD, help='avisar vencimentos dos próximos N dias')
+    @click.option('--sender', default=None, help='file, webhook ou pacote.modulo:Classe')
+    @click.option('--dry-run', is_flag=True, help='só conta as mensagens, sem enviar')
+    def send_reminders_command(days_ahead, sender, dry_run):
+        """Envia lembretes de mensalidades a vencer e em atraso."""
+        config = dict(app.config, REMINDER_SENDER=sender or app.config['REMINDER_SENDER'])
+        report = send_reminders(config, days_ahead=days_ahead, dry_run=dry_run)
+        print(f'{report.messages} mensagens, {report.sent} enviadas, {report.failed} com falha, '
+              f'{report.deduped} avisos já enviados antes, {report.no_phone} responsáveis sem telefone')
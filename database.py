@@ -0,0 +1,85 @@
+import os
+from contextlib import contextmanager
+from functools import wraps
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+
+# --- CONFIGURAÇÃO DO BANCO ---
+# Pool de conexões e timeouts vêm de variáveis de ambiente. No SQLite (uso
+# local) nada muda; no PostgreSQL cada worker do gunicorn mantém um pool
+# pequeno, testa a conexão antes de usar (pre-ping, evita erro depois de
+# muito tempo parado) e recicla conexões antigas.
+#
+#   DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE (segundos)
+#   DB_STATEMENT_TIMEOUT (ms; 0 desliga)
+#   DATABASE_REPLICA_URL: réplica de leitura para as telas marcadas com @read_only
+
+REPLICA = 'replica'
+
+
+def normalize_url(url):
+    # Correção necessária para o Render/Heroku reconhecer o link do Postgres
+    if url and url.startswith('postgres://'):
+        url = url.replace('postgres://', 'postgresql://', 1)
+    return url
+
+
+def engine_options(url):
+    if not url.startswith('postgresql'):
+        return {}
+    options = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 5)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True,
+    }
+    statement_timeout = int(os.environ.get('DB_STATEMENT_TIMEOUT', 30000))
+    if statement_timeout:
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+    return options
+
+
+def init_database(app):
+    url = normalize_url(os.environ.get('DATABASE_URL', 'sqlite:///escola.db'))
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(url)
+
+    replica_url = normalize_url(os.environ.get('DATABASE_REPLICA_URL'))
+    if replica_url:
+        app.config['SQLALCHEMY_BINDS'] = {REPLICA: {'url': replica_url, **engine_options(replica_url)}}
+
+
+# --- RÉPLICA DE LEITURA ---
+# Rotas com @read_only fazem as consultas na réplica, se houver uma
+# configurada. Flush (qualquer escrita do ORM) continua indo para o banco
+# principal. A réplica pode estar alguns segundos atrasada.
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context() and g.get('read_only'):
+            engine = self._db.engines.get(REPLICA)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@contextmanager
+def primary():
+    # Dentro de uma rota @read_only, força as consultas no banco principal
+    previous = g.get('read_only') if has_app_context() else None
+    if has_app_context():
+        g.read_only = False
+    try:
+        yield
+    finally:
+        if has_app_context():
+            g.read_only = previous
+
+
+def read_only(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_only = True
+        return view(*args, **kwargs)
+    return wrapper
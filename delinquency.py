@@ -0,0 +1,105 @@
+from datetime import date, timedelta
+from sqlalchemy import func, case, and_
+
+from models import db, Student, Guardian, Fee, Class
+
+# --- RELATÓRIO DE INADIMPLÊNCIA ---
+# Quem deve, quanto e há quanto tempo. Tudo é calculado no banco: só
+# mensalidades pendentes com vencimento antes de hoje (índice
+# ix_fee_status_due_date), agrupadas por aluno ou por responsável, com o
+# valor em aberto separado em faixas de atraso contadas a partir do vencimento.
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# (chave, título, dias de atraso: de, até)
+BUCKETS = [
+    ('d0_30', '0-30 dias', 0, 30),
+    ('d31_60', '31-60 dias', 31, 60),
+    ('d61_90', '61-90 dias', 61, 90),
+    ('d90_plus', '90+ dias', 91, None),
+]
+
+SORTS = ['total', 'oldest', 'name', 'fees'] + [key for key, _, _, _ in BUCKETS]
+
+DELINQUENT_STUDENT_HEADER = ['ID', 'Aluno', 'Turma', 'Responsável', 'Telefone', 'Parcelas', 'Vencimento mais antigo',
+                            'Total'] + [title for _, title, _, _ in BUCKETS]
+
+DELINQUENT_GUARDIAN_HEADER = ['ID', 'Responsável', 'CPF', 'Telefone', 'Alunos', 'Parcelas', 'Vencimento mais antigo',
+                             'Total'] + [title for _, title, _, _ in BUCKETS]
+
+
+def aggregates(today):
+    columns = [
+        func.count(Fee.id).label('fees'),
+        func.min(Fee.due_date).label('oldest'),
+        func.sum(Fee.amount).label('total'),
+    ]
+    for key, _, start, end in BUCKETS:
+        # Atraso em dias = hoje - vencimento; comparado como data para usar o índice
+        in_bucket = [Fee.due_date <= today - timedelta(days=start)]
+        if end is not None:
+            in_bucket.append(Fee.due_date >= today - timedelta(days=end))
+        columns.append(func.sum(case((and_(*in_bucket), Fee.amount), else_=0.0)).label(key))
+    return columns
+
+
+def group_columns(by):
+    if by == 'guardian':
+        return [Guardian.id.label('id'), Guardian.name.label('name'), Guardian.cpf.label('cpf'),
+                Guardian.phone.label('phone')]
+    return [Student.id.label('id'), Student.name.label('name'), Class.name.label('class_name'),
+            Guardian.name.label('guardian_name'), Guardian.phone.label('phone')]
+
+
+def overdue_query(columns, by='student', class_id=None, today=None):
+    query = db.session.query(*columns).select_from(Fee) \
+        .join(Student, Fee.student_id == Student.id)
+    if by == 'guardian':
+        # Alunos sem responsável não aparecem na visão por responsável
+        query = query.join(Guardian, Student.guardian_id == Guardian.id)
+    else:
+        query = query.outerjoin(Class, Student.class_id == Class.id) \
+            .outerjoin(Guardian, Student.guardian_id == Guardian.id)
+
+    query = query.filter(Fee.status == 'pendente', Fee.due_date < (today or date.today()))
+    if class_id:
+        query = query.filter(Student.class_id == class_id)
+    return query
+
+
+def report_query(by='student', class_id=None, sort='total', order=None, today=None):
+    today = today or date.today()
+    groups = group_columns(by)
+    extra = [func.count(func.distinct(Student.id)).label('students')] if by == 'guardian' else []
+    columns = groups + extra + aggregates(today)
+    query = overdue_query(columns, by, class_id, today).group_by(*groups)
+
+    # Nome e vencimento mais antigo: crescente por padrão; valores: decrescente
+    sort = sort if sort in SORTS else 'total'
+    if order not in ('asc', 'desc'):
+        order = 'asc' if sort in ('name', 'oldest') else 'desc'
+    column = {c.key: c for c in columns}[sort]
+    return query.order_by(column.asc() if order == 'asc' else column.desc(), groups[0])
+
+
+def fetch_report(by='student', class_id=None, sort='total', order=None, page=1, limit=PAGE_SIZE, today=None):
+    limit = max(1, min(limit or PAGE_SIZE, MAX_PAGE_SIZE))
+    page = max(1, page or 1)
+    rows = report_query(by, class_id, sort, order, today) \
+        .offset((page - 1) * limit).limit(limit + 1).all()
+    return rows[:limit], len(rows) > limit
+
+
+def report_totals(by='student', class_id=None, today=None):
+    # Uma linha com os totais gerais (todas as páginas)
+    today = today or date.today()
+    id_column = Guardian.id if by == 'guardian' else Student.id
+    columns = [func.count(func.distinct(id_column)).label('debtors')] + aggregates(today)
+    return overdue_query(columns, by, class_id, today).one()
+
+
+def report_rows(by='student', class_id=None, sort='total', order=None):
+    # Para a exportação: todas as linhas, lidas em lotes
+    for row in report_query(by, class_id, sort, order).execution_options(stream_results=True, yield_per=1000):
+        yield tuple(row)
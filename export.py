@@ -0,0 +1,129 @@
+import csv
+import importlib.util
+import io
+from datetime import date
+
+from models import db, Student, Guardian, Fee, Class
+from delinquency import report_rows
+
+# --- EXPORTAÇÃO (CSV / XLSX) ---
+# As consultas trazem só as colunas necessárias e são lidas em lotes
+# (yield_per + stream_results = cursor do lado do servidor no PostgreSQL).
+# O CSV é escrito linha a linha num gerador, então a memória não cresce
+# com o tamanho do extrato. O XLSX é montado no pool de tarefas (ver jobs.py),
+# fora do worker do gunicorn.
+
+BATCH_SIZE = 1000
+
+FEE_HEADER = ['ID', 'Aluno', 'Turma', 'Responsável', 'CPF', 'Telefone',
+              'Mês', 'Ano', 'Valor', 'Status', 'Vencimento', 'Pagamento']
+
+STUDENT_HEADER = ['ID', 'Aluno', 'Nascimento', 'Turma', 'Responsável', 'CPF', 'Telefone', 'Parentesco']
+
+
+def _streamed(query):
+    return query.execution_options(stream_results=True, yield_per=BATCH_SIZE)
+
+
+def fee_rows(status=None, month=None, year=None, class_id=None, student_id=None):
+    query = db.session.query(
+        Fee.id, Student.name, Class.name, Guardian.name, Guardian.cpf, Guardian.phone,
+        Fee.month, Fee.year, Fee.amount, Fee.status, Fee.due_date, Fee.payment_date
+    ).join(Student, Fee.student_id == Student.id) \
+     .outerjoin(Class, Student.class_id == Class.id) \
+     .outerjoin(Guardian, Student.guardian_id == Guardian.id)
+
+    if status:
+        query = query.filter(Fee.status == status)
+    if month:
+        query = query.filter(Fee.month == month)
+    if year:
+        query = query.filter(Fee.year == year)
+    if class_id:
+        query = query.filter(Student.class_id == class_id)
+    if student_id:
+        query = query.filter(Fee.student_id == student_id)
+
+    return _streamed(query.order_by(Fee.due_date, Fee.id))
+
+
+def student_rows(class_id=None):
+    query = db.session.query(
+        Student.id, Student.name, Student.birth_date, Class.name,
+        Guardian.name, Guardian.cpf, Guardian.phone, Guardian.relation
+    ).outerjoin(Class, Student.class_id == Class.id) \
+     .outerjoin(Guardian, Student.guardian_id == Guardian.id)
+
+    if class_id:
+        query = query.filter(Student.class_id == class_id)
+
+    return _streamed(query.order_by(Student.name, Student.id))
+
+
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _safe_text(value):
+    # Nomes/CPFs digitados pelo usuário: "=..." viraria fórmula no Excel
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _csv_value(value):
+    # Formato brasileiro, para abrir direto no Excel
+    if isinstance(value, float):
+        return f'{value:.2f}'.replace('.', ',')
+    if isinstance(value, date):
+        return value.strftime('%d/%m/%Y')
+    return '' if value is None else _safe_text(value)
+
+
+def stream_csv(header, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+
+    # BOM para o Excel reconhecer UTF-8 (acentos)
+    buffer.write('\ufeff')
+    writer.writerow(header)
+    for i, row in enumerate(rows, start=1):
+        writer.writerow([_csv_value(v) for v in row])
+        if i % BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
+
+
+def xlsx_available():
+    return importlib.util.find_spec('openpyxl') is not None
+
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Fontes das exportações: a tarefa recebe só o nome e os filtros (dados simples)
+EXPORT_ROWS = {
+    'fees': fee_rows,
+    'students': student_rows,
+    'delinquency': report_rows,
+}
+
+
+def build_xlsx(header, rows, output_path):
+    # openpyxl é opcional; no modo write_only as linhas não ficam em memória
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(header)
+    for row in rows:
+        sheet.append([_safe_text(v) for v in row])
+    workbook.save(output_path)
+
+
+def write_xlsx_export(output_path, kind, header, filters):
+    # Executa no processo do pool de jobs (ver jobs.py): cria o próprio app
+    from app import app
+
+    with app.app_context():
+        build_xlsx(header, EXPORT_ROWS[kind](**filters), output_path)
@@ -0,0 +1,203 @@
+import gzip
+import hashlib
+import os
+from datetime import datetime
+from functools import lru_cache, wraps
+from flask import request, session, make_response
+from flask_login import current_user
+from sqlalchemy import event, update, insert, select
+from sqlalchemy.orm import Session
+
+from models import db, TableVersion
+
+# --- CACHE HTTP (ETag / Last-Modified / 304) ---
+# Cada tabela tem um número de versão em TableVersion, incrementado no commit
+# de qualquer transação que escreveu nela (objetos do ORM ou INSERT/UPDATE/
+# DELETE em massa pela sessão). As telas marcadas com @conditional('tabela')
+# montam o ETag a partir dessas versões: se o navegador já tem a página
+# (If-None-Match / If-Modified-Since), devolvemos 304 sem consultar nem
+# renderizar nada além de uma leitura de TableVersion.
+#
+# Arquivos de static/ recebem ?v=<hash do conteúdo> no url_for e, com o hash
+# certo, um Cache-Control de um ano.
+#
+# Respostas JSON marcadas com @compressed saem em gzip quando o navegador aceita.
+
+STATIC_MAX_AGE = 365 * 24 * 3600
+GZIP_MIN_SIZE = 500
+
+
+# --- VERSÃO DAS TABELAS ---
+
+def _touched(session):
+    return session.info.setdefault('touched_tables', set())
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_flushed(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, '__tablename__', None)
+        if table and (obj not in session.dirty or session.is_modified(obj)):
+            _touched(session).add(table)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is None or table.name == TableVersion.__tablename__:
+            return None
+        # Executa aqui para ver quantas linhas mudaram: UPDATE/DELETE que não
+        # pegou nada (ou INSERT ... ON CONFLICT DO NOTHING só com repetidos)
+        # não invalida o cache. rowcount -1 (desconhecido) conta como escrita.
+        result = orm_execute_state.invoke_statement()
+        if getattr(result, 'rowcount', -1) != 0:
+            _touched(orm_execute_state.session).add(table.name)
+        return result
+
+
+@event.listens_for(Session, 'before_commit')
+def _bump_versions(session):
+    session.flush()
+    # Um único UPDATE para as tabelas escritas; nenhum se nada mudou
+    tables = session.info.pop('touched_tables', None)
+    if tables:
+        session.connection().execute(
+            update(TableVersion.__table__)
+            .where(TableVersion.name.in_(sorted(tables)))
+            .values(version=TableVersion.version + 1, updated_at=datetime.now())
+        )
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_touched(session):
+    session.info.pop('touched_tables', None)
+
+
+def ensure_version_rows():
+    # Uma linha por tabela do modelo (chamado pelas migrações)
+    existing = set(db.session.scalars(select(TableVersion.name)))
+    missing = [t.name for t in db.metadata.sorted_tables if t.name not in existing]
+    if missing:
+        db.session.execute(insert(TableVersion), [{'name': name, 'version': 0} for name in missing])
+        db.session.commit()
+
+
+# --- RESPOSTAS CONDICIONAIS ---
+
+@lru_cache(maxsize=None)
+def build_id():
+    # Muda a cada deploy (igual em todos os workers): o commit publicado no
+    # Render ou, fora dele, o hash de templates/ e static/ -- calculado no
+    # primeiro uso, não ao importar o módulo
+    commit = os.environ.get('RENDER_GIT_COMMIT')
+    if commit:
+        return commit[:12]
+    digest = hashlib.sha256()
+    base = os.path.dirname(os.path.abspath(__file__))
+    for folder in ('templates', 'static'):
+        for root, _, files in sorted(os.walk(os.path.join(base, folder))):
+            for name in sorted(files):
+                with open(os.path.join(root, name), 'rb') as f:
+                    digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+def conditional(*tables):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Mensagens flash pendentes precisam ser renderizadas
+            if request.method != 'GET' or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            rows = db.session.query(TableVersion.name, TableVersion.version, TableVersion.updated_at) \
+                .filter(TableVersion.name.in_(tables)).all()
+            versions = '.'.join(f'{name}{version}' for name, version, _ in sorted(rows))
+            user = f'{current_user.id}-{current_user.role}' if current_user.is_authenticated else 'anon'
+            # Versão gzip e sem compressão não podem ter o mesmo ETag
+            encoding = request.accept_encodings.best_match(['gzip']) or ''
+            etag = hashlib.sha256(
+                f'{build_id()}|{user}|{request.full_path}|{versions}|{encoding}'.encode()
+            ).hexdigest()[:32]
+            last_modified = max((updated for _, _, updated in rows), default=None)
+
+            if request.if_none_match.contains(etag) or (
+                not request.if_none_match and last_modified and request.if_modified_since
+                and last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+            ):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            if last_modified:
+                response.last_modified = last_modified
+            # Páginas com login: o navegador guarda, mas confirma a cada visita
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
+
+
+# --- COMPRESSÃO ---
+
+def gzip_response(response):
+    if response.status_code != 200 or response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return response
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < GZIP_MIN_SIZE or not request.accept_encodings.best_match(['gzip']):
+        return response
+    response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def compressed(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        return gzip_response(make_response(view(*args, **kwargs)))
+    return wrapper
+
+
+# --- ARQUIVOS ESTÁTICOS COM HASH ---
+
+_static_hashes = {}
+
+
+def static_hash(static_folder, filename):
+    path = os.path.join(static_folder, filename)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _static_hashes.get(filename)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    _static_hashes[filename] = (mtime, digest)
+    return digest
+
+
+def init_http_cache(app):
+    @app.url_defaults
+    def _static_version(endpoint, values):
+        if endpoint == 'static' and 'filename' in values and 'v' not in values:
+            digest = static_hash(app.static_folder, values['filename'])
+            if digest:
+                values['v'] = digest
+
+    @app.after_request
+    def _static_cache_headers(response):
+        if request.endpoint == 'static' and response.status_code in (200, 304):
+            digest = static_hash(app.static_folder, request.view_args.get('filename', ''))
+            if digest and request.args.get('v') == digest:
+                response.cache_control.no_cache = None
+                response.cache_control.public = True
+                response.cache_control.max_age = STATIC_MAX_AGE
+                response.cache_control.immutable = True
+        return response
@@ -0,0 +1,295 @@
+import codecs
+import csv
+import io
+from datetime import date, datetime
+from sqlalchemy import insert
+
+from models import db, Student, Guardian, Class, Fee
+from kpis import MESES_ORDEM
+from billing import fee_insert
+from utils import normalizar, somente_digitos
+
+# --- IMPORTAÇÃO EM LOTE (CSV) ---
+# Lê o arquivo aos poucos, valida em lotes de BATCH_SIZE linhas e grava cada
+# lote com INSERTs em massa numa transação própria. Responsáveis são
+# deduplicados por CPF (ou pelo nome, quando não há CPF) num índice em
+# memória carregado uma única vez, e que vai sendo atualizado durante a
+# importação. Linhas com erro são puladas e listadas no relatório.
+#
+# Alunos: aluno; nascimento; turma; responsavel; cpf; telefone; parentesco
+# Mensalidades (opcional): aluno; turma; mes; ano; valor; status; vencimento; pagamento
+# (sem vencimento, vale o dia 10 do mês, como na geração em lote)
+
+BATCH_SIZE = 1000
+
+# "marco", "MARÇO" -> "Março"
+MESES = {normalizar(m): m for m in MESES_ORDEM}
+
+STUDENT_COLUMNS = ['aluno', 'nascimento', 'turma', 'responsavel', 'cpf', 'telefone', 'parentesco']
+FEE_COLUMNS = ['aluno', 'turma', 'mes', 'ano', 'valor', 'status', 'vencimento', 'pagamento']
+
+
+class ImportReport:
+    def __init__(self):
+        self.students = 0
+        self.guardians = 0
+        self.classes = 0
+        self.fees = 0
+        self.skipped = 0
+        self.errors = []  # (linha, mensagem)
+
+    def error(self, line, message):
+        self.errors.append((line, message))
+
+
+class ExcelPtBr(csv.excel):
+    delimiter = ';'
+
+
+def detect_encoding(stream):
+    # Excel pt-BR salva em UTF-8 (com BOM) ou cp1252 ("CSV do Windows"). Lê
+    # em blocos para decidir, sem carregar o arquivo inteiro, e volta ao início.
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        for chunk in iter(lambda: stream.read(64 * 1024), b''):
+            decoder.decode(chunk)
+        decoder.decode(b'', final=True)
+        encoding = 'utf-8-sig'
+    except UnicodeDecodeError:
+        encoding = 'cp1252'
+    stream.seek(0)
+    return encoding
+
+
+def read_csv(file_storage):
+    # Aceita ";" ou "," e arquivos salvos pelo Excel (UTF-8 com BOM ou cp1252)
+    encoding = detect_encoding(file_storage.stream)
+    text = io.TextIOWrapper(file_storage.stream, encoding=encoding, errors='replace', newline='')
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=';,')
+    except csv.Error:
+        dialect = ExcelPtBr
+    reader = csv.reader(text, dialect)
+    header = [normalizar(h).replace(' ', '_') for h in next(reader, [])]
+    for line, row in enumerate(reader, start=2):
+        if any(cell.strip() for cell in row):
+            yield line, dict(zip(header, (cell.strip() for cell in row)))
+
+
+def parse_date(value):
+    for fmt in ('%d/%m/%Y', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f'data inválida: "{value}"')
+
+
+def parse_amount(value):
+    # "1.234,56" (Excel pt-BR) ou "1234.56"
+    if ',' in value:
+        value = value.replace('.', '').replace(',', '.')
+    return float(value)
+
+
+def batches(rows):
+    batch = []
+    for item in rows:
+        batch.append(item)
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class StudentImporter:
+    def __init__(self, report):
+        self.report = report
+        self.load_indexes()
+
+    def load_indexes(self):
+        # Índices em memória: uma consulta por tabela, no início
+        self.guardians_by_cpf = {}
+        self.guardians_by_name = {}
+        for g_id, name, cpf in db.session.query(Guardian.id, Guardian.name, Guardian.cpf):
+            if somente_digitos(cpf):
+                self.guardians_by_cpf[somente_digitos(cpf)] = g_id
+            else:
+                self.guardians_by_name.setdefault(normalizar(name), g_id)
+        self.students = {
+            (normalizar(name), birth) for name, birth in db.session.query(Student.name, Student.birth_date)
+        }
+        # Nome da turma -> id; com o mesmo nome em vários anos, vale o mais recente
+        self.classes = {
+            normalizar(name): c_id
+            for c_id, name in db.session.query(Class.id, Class.name).order_by(Class.year, Class.id)
+        }
+
+    def guardian_key(self, row):
+        cpf = somente_digitos(row.get('cpf'))
+        return ('cpf', cpf) if cpf else ('nome', normalizar(row.get('responsavel')))
+
+    def known_guardian(self, key):
+        kind, value = key
+        return (self.guardians_by_cpf if kind == 'cpf' else self.guardians_by_name).get(value)
+
+    def validate(self, row):
+        name = row.get('aluno', '')
+        if not name:
+            raise ValueError('nome do aluno vazio')
+        birth = parse_date(row.get('nascimento', ''))
+        if (normalizar(name), birth) in self.students:
+            return None  # já cadastrado: importar de novo não duplica
+        return {'name': name, 'birth_date': birth, 'class_name': row.get('turma') or None}
+
+    def import_batch(self, batch):
+        students = []
+        new_guardians = {}  # chave -> dados, sem repetir dentro do lote
+        for line, row in batch:
+            try:
+                student = self.validate(row)
+            except ValueError as e:
+                self.report.error(line, str(e))
+                continue
+            if student is None:
+                self.report.skipped += 1
+                continue
+
+            guardian_key = None
+            if row.get('responsavel') or somente_digitos(row.get('cpf')):
+                guardian_key = self.guardian_key(row)
+                if not self.known_guardian(guardian_key) and guardian_key not in new_guardians:
+                    new_guardians[guardian_key] = {
+                        'name': row.get('responsavel') or 'Não informado',
+                        'cpf': row.get('cpf', ''),
+                        'phone': row.get('telefone', ''),
+                        'relation': row.get('parentesco', ''),
+                    }
+            students.append((student, guardian_key))
+            self.students.add((normalizar(student['name']), student['birth_date']))
+
+        # Responsáveis novos: um INSERT em massa, ids devolvidos na mesma ordem
+        if new_guardians:
+            keys = list(new_guardians)
+            ids = db.session.scalars(
+                insert(Guardian).returning(Guardian.id, sort_by_parameter_order=True),
+                [new_guardians[k] for k in keys]
+            ).all()
+            for (kind, value), g_id in zip(keys, ids):
+                (self.guardians_by_cpf if kind == 'cpf' else self.guardians_by_name)[value] = g_id
+            self.report.guardians += len(ids)
+
+        # Turmas que ainda não existem são criadas no ano corrente
+        new_classes = {}
+        for student, _ in students:
+            if student['class_name'] and normalizar(student['class_name']) not in self.classes:
+                new_classes.setdefault(normalizar(student['class_name']), student['class_name'])
+        if new_classes:
+            keys = list(new_classes)
+            ids = db.session.scalars(
+                insert(Class).returning(Class.id, sort_by_parameter_order=True),
+                [{'name': new_classes[k], 'year': datetime.now().year} for k in keys]
+            ).all()
+            self.classes.update(zip(keys, ids))
+            self.report.classes += len(ids)
+
+        if students:
+            for student, guardian_key in students:
+                student['guardian_id'] = self.known_guardian(guardian_key) if guardian_key else None
+                class_name = student.pop('class_name')
+                student['class_id'] = self.classes[normalizar(class_name)] if class_name else None
+            db.session.execute(insert(Student), [s for s, _ in students])
+            self.report.students += len(students)
+
+        db.session.commit()
+
+    def run(self, rows):
+        for batch in batches(rows):
+            try:
+                self.import_batch(batch)
+            except Exception as e:
+                # Só este lote é perdido; os anteriores já foram gravados.
+                # Os índices podem ter ids do lote desfeito: recarrega do banco.
+                db.session.rollback()
+                self.load_indexes()
+                self.report.error(batch[0][0], f'lote de {len(batch)} linhas não gravado: {e.__class__.__name__}')
+
+
+class FeeImporter:
+    def __init__(self, report):
+        self.report = report
+        # (aluno, turma) -> id; nomes repetidos na mesma turma ficam ambíguos
+        self.students = {}
+        rows = db.session.query(Student.id, Student.name, Class.name) \
+            .outerjoin(Class, Student.class_id == Class.id)
+        for s_id, name, class_name in rows:
+            key = (normalizar(name), normalizar(class_name))
+            self.students[key] = None if key in self.students else s_id
+
+    def validate(self, row):
+        key = (normalizar(row.get('aluno')), normalizar(row.get('turma')))
+        if key not in self.students:
+            raise ValueError(f'aluno não encontrado: "{row.get("aluno")}" ({row.get("turma")})')
+        if self.students[key] is None:
+            raise ValueError(f'aluno ambíguo (mesmo nome na turma): "{row.get("aluno")}"')
+
+        month = MESES.get(normalizar(row.get('mes')))
+        if not month:
+            raise ValueError(f'mês inválido: "{row.get("mes")}"')
+        status = (row.get('status') or 'pendente').lower()
+        if status not in ('pago', 'pendente'):
+            raise ValueError(f'status inválido: "{row.get("status")}"')
+
+        due_date = parse_date(row['vencimento']) if row.get('vencimento') else None
+        year = int(row['ano']) if row.get('ano') else (due_date.year if due_date else None)
+        if not year:
+            raise ValueError('informe o ano ou o vencimento')
+        if due_date is None:
+            due_date = date(year, MESES_ORDEM.index(month) + 1, 10)
+        payment_date = parse_date(row['pagamento']) if row.get('pagamento') else None
+
+        return {
+            'student_id': self.students[key],
+            'month': month,
+            'year': year,
+            'amount': parse_amount(row.get('valor', '')),
+            'status': status,
+            'due_date': due_date,
+            'payment_date': payment_date if status == 'pago' else None,
+        }
+
+    def import_batch(self, batch):
+        fees = []
+        for line, row in batch:
+            try:
+                fees.append(self.validate(row))
+            except (ValueError, KeyError) as e:
+                self.report.error(line, str(e))
+        inserted = 0
+        if fees:
+            # Mensalidades já existentes (aluno/mês/ano) são ignoradas: conta
+            # só as gravadas (RETURNING; o rowcount de executemany não é confiável)
+            inserted = len(db.session.execute(fee_insert().returning(Fee.id), fees).all())
+        db.session.commit()
+        self.report.fees += inserted
+
+    def run(self, rows):
+        for batch in batches(rows):
+            try:
+                self.import_batch(batch)
+            except Exception as e:
+                # Só este lote é perdido; os anteriores já foram gravados e
+                # report.fees diz se o resumo financeiro precisa ser refeito
+                db.session.rollback()
+                self.report.error(batch[0][0], f'lote de {len(batch)} linhas não gravado: {e.__class__.__name__}')
+
+
+def import_school(students_file, fees_file=None):
+    report = ImportReport()
+    StudentImporter(report).run(read_csv(students_file))
+    if fees_file:
+        FeeImporter(report).run(read_csv(fees_file))
+    return report
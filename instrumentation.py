@@ -0,0 +1,184 @@
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from threading import Lock
+from flask import g, request, has_app_context, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+# --- INSTRUMENTAÇÃO POR REQUISIÇÃO ---
+# Sempre ligado: mede a latência de cada endpoint, quantas consultas SQL ele
+# fez e quanto tempo passou no banco, o tempo de renderização dos templates e
+# dos PDFs. Tudo fica em memória (por processo) e sai em /metrics no formato
+# texto do Prometheus.
+#
+# Com QUERY_STATS=1 também devolve a contagem nos cabeçalhos X-Query-Count /
+# X-N-Plus-One e avisa no log quando o mesmo relacionamento é carregado
+# preguiçosamente (lazy load) muitas vezes -- o padrão N+1.
+
+# A partir de quantos lazy loads do mesmo relacionamento consideramos N+1
+N_PLUS_ONE_THRESHOLD = 5
+
+# Limites (em segundos) dos histogramas
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, limit in enumerate(BUCKETS):
+            if value <= limit:
+                self.buckets[i] += 1
+
+
+_lock = Lock()
+_request_seconds = defaultdict(Histogram)   # por endpoint
+_template_seconds = defaultdict(Histogram)  # por template
+_pdf_seconds = defaultdict(Histogram)       # por tipo de PDF
+_requests_total = Counter()                 # por (endpoint, status)
+_sql_queries_total = Counter()              # por endpoint
+_db_seconds_total = Counter()               # por endpoint
+
+
+def _request_stats():
+    if not has_app_context():
+        return None
+    return g.get('query_stats')
+
+
+def _before_statement(conn, cursor, statement, parameters, context, executemany):
+    stats = _request_stats()
+    if stats is not None:
+        stats['queries'] += 1
+        context._query_start = time.perf_counter()
+
+
+def _after_statement(conn, cursor, statement, parameters, context, executemany):
+    stats = _request_stats()
+    start = getattr(context, '_query_start', None)
+    if stats is not None and start is not None:
+        stats['db_seconds'] += time.perf_counter() - start
+
+
+def _count_lazy_load(orm_execute_state):
+    stats = _request_stats()
+    # lazy_loaded_from só existe em SELECTs (INSERT/UPDATE em lote não têm)
+    if stats is None or not orm_execute_state.is_select:
+        return
+    if orm_execute_state.lazy_loaded_from is not None:
+        # Ex.: "Student.guardian"
+        stats['lazy_loads'][str(orm_execute_state.loader_strategy_path[-1])] += 1
+
+
+def _before_template(sender, template, context, **extra):
+    g.setdefault('template_start', {})[template.name] = time.perf_counter()
+
+
+def _after_template(sender, template, context, **extra):
+    start = g.get('template_start', {}).pop(template.name, None)
+    if start is not None:
+        with _lock:
+            _template_seconds[template.name].observe(time.perf_counter() - start)
+
+
+@contextmanager
+def timed_pdf(kind):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _lock:
+            _pdf_seconds[kind].observe(time.perf_counter() - start)
+
+
+# Ouvintes globais (toda Engine/Session do processo): registrados uma vez só,
+# mesmo que init_instrumentation rode de novo (ex.: outro app nos testes)
+GLOBAL_LISTENERS = (
+    (Engine, 'before_cursor_execute', _before_statement),
+    (Engine, 'after_cursor_execute', _after_statement),
+    (Session, 'do_orm_execute', _count_lazy_load),
+)
+
+
+def init_instrumentation(app):
+    for target, name, listener in GLOBAL_LISTENERS:
+        if not event.contains(target, name, listener):
+            event.listen(target, name, listener)
+    before_render_template.connect(_before_template, app)
+    template_rendered.connect(_after_template, app)
+
+    @app.before_request
+    def start_query_stats():
+        g.query_stats = {
+            'queries': 0,
+            'db_seconds': 0.0,
+            'lazy_loads': Counter(),
+            'start': time.perf_counter(),
+        }
+
+    @app.after_request
+    def report_query_stats(response):
+        stats = g.pop('query_stats', None)
+        if stats is None:
+            return response
+
+        endpoint = request.endpoint or 'desconhecido'
+        with _lock:
+            _request_seconds[endpoint].observe(time.perf_counter() - stats['start'])
+            _requests_total[(endpoint, response.status_code)] += 1
+            _sql_queries_total[endpoint] += stats['queries']
+            _db_seconds_total[endpoint] += stats['db_seconds']
+
+        if not app.config.get('QUERY_STATS'):
+            return response
+
+        suspects = {name: total for name, total in stats['lazy_loads'].items()
+                    if total >= N_PLUS_ONE_THRESHOLD}
+
+        response.headers['X-Query-Count'] = str(stats['queries'])
+        if suspects:
+            response.headers['X-N-Plus-One'] = ', '.join(f'{n}={t}' for n, t in suspects.items())
+            app.logger.warning('N+1 em %s %s: %s', request.method, request.path, suspects)
+        app.logger.info('%s %s: %d consultas SQL', request.method, request.path, stats['queries'])
+        return response
+
+
+# --- SAÍDA NO FORMATO PROMETHEUS ---
+
+def _histogram_lines(name, label, histograms):
+    lines = [f'# TYPE {name} histogram']
+    for value, hist in sorted(histograms.items()):
+        for limit, total in zip(BUCKETS, hist.buckets):
+            lines.append(f'{name}_bucket{{{label}="{value}",le="{limit}"}} {total}')
+        lines.append(f'{name}_bucket{{{label}="{value}",le="+Inf"}} {hist.count}')
+        lines.append(f'{name}_sum{{{label}="{value}"}} {hist.sum}')
+        lines.append(f'{name}_count{{{label}="{value}"}} {hist.count}')
+    return lines
+
+
+def render_metrics():
+    with _lock:
+        lines = _histogram_lines('eduaxis_request_duration_seconds', 'endpoint', _request_seconds)
+
+        lines.append('# TYPE eduaxis_requests_total counter')
+        for (endpoint, status), total in sorted(_requests_total.items()):
+            lines.append(f'eduaxis_requests_total{{endpoint="{endpoint}",status="{status}"}} {total}')
+
+        lines.append('# TYPE eduaxis_sql_queries_total counter')
+        for endpoint, total in sorted(_sql_queries_total.items()):
+            lines.append(f'eduaxis_sql_queries_total{{endpoint="{endpoint}"}} {total}')
+
+        lines.append('# TYPE eduaxis_db_seconds_total counter')
+        for endpoint, total in sorted(_db_seconds_total.items()):
+            lines.append(f'eduaxis_db_seconds_total{{endpoint="{endpoint}"}} {total}')
+
+        lines += _histogram_lines('eduaxis_template_render_seconds', 'template', _template_seconds)
+        lines += _histogram_lines('eduaxis_pdf_render_seconds', 'kind', _pdf_seconds)
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,150 @@
+import json
+import multiprocessing
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+
+# --- FILA LOCAL DE TAREFAS PESADAS ---
+# PDFs em lote e relatórios grandes rodam num pool de processos, fora do
+# worker do gunicorn. O estado de cada tarefa fica em arquivos
+# (JOBS_DIR/<id>/status.json), então qualquer worker consegue responder à
+# consulta de status e ao download, sem precisar de broker externo.
+# Cada worker do gunicorn tem o seu pool: por padrão só 1 processo filho
+# (JOBS_WORKERS), senão workers x CPUs processos disputam a mesma máquina.
+
+JOB_TTL_SECONDS = 24 * 60 * 60
+# Tarefa "running"/"queued" há mais que isso é dada como perdida (processo
+# morto por OOM, worker reiniciado...)
+JOB_TIMEOUT_SECONDS = 30 * 60
+
+_executor = None
+_executor_lock = Lock()
+_config = {'dir': None, 'workers': None, 'timeout': None}
+
+
+def init_jobs(app):
+    _config['dir'] = app.config.get('JOBS_DIR') or os.path.join(app.instance_path, 'jobs')
+    _config['workers'] = int(app.config.get('JOBS_WORKERS') or os.environ.get('JOBS_WORKERS', 1))
+    _config['timeout'] = int(app.config.get('JOBS_TIMEOUT') or os.environ.get('JOBS_TIMEOUT', JOB_TIMEOUT_SECONDS))
+    os.makedirs(_config['dir'], exist_ok=True)
+
+
+def get_executor():
+    # Criado sob demanda: cada worker do gunicorn tem o seu pool, criado
+    # depois do fork. "spawn" evita herdar conexões de banco e locks.
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=_config['workers'],
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _executor
+
+
+def _discard_executor(executor):
+    # Pool quebrado (filho morto) não aceita mais tarefas: o próximo
+    # get_executor cria outro
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def job_dir(job_id):
+    return os.path.join(_config['dir'], job_id)
+
+
+def write_status(job_id, **fields):
+    path = os.path.join(job_dir(job_id), 'status.json')
+    status = read_status(job_id) or {}
+    status.update(fields)
+    # Escrita atômica: quem está lendo nunca vê um JSON pela metade
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(status, f)
+    os.replace(tmp_path, path)
+    return status
+
+
+def read_status(job_id):
+    try:
+        with open(os.path.join(job_dir(job_id), 'status.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _run_job(jobs_dir, job_id, func, args):
+    # Executa no processo filho
+    _config['dir'] = jobs_dir
+    write_status(job_id, status='running', started_at=time.time())
+    try:
+        func(os.path.join(job_dir(job_id), 'result'), *args)
+    except Exception as e:
+        write_status(job_id, status='error', error=str(e), finished_at=time.time())
+        return
+    write_status(job_id, status='done', finished_at=time.time())
+
+
+def submit_job(kind, func, args, filename, mimetype):
+    # func precisa ser uma função de módulo (serializável) que recebe o
+    # caminho do arquivo de saída seguido de args (apenas dados simples).
+    cleanup_old_jobs()
+    job_id = uuid.uuid4().hex
+    os.makedirs(job_dir(job_id))
+    write_status(job_id, id=job_id, kind=kind, status='queued', created_at=time.time(),
+                 filename=filename, mimetype=mimetype)
+    executor = get_executor()
+    try:
+        future = executor.submit(_run_job, _config['dir'], job_id, func, args)
+    except BrokenProcessPool:
+        _discard_executor(executor)
+        executor = get_executor()
+        future = executor.submit(_run_job, _config['dir'], job_id, func, args)
+    future.add_done_callback(lambda f: _job_finished(executor, job_id, f))
+    return job_id
+
+
+def _job_finished(executor, job_id, future):
+    # Roda no processo pai. Erros da própria tarefa já foram gravados por
+    # _run_job; aqui chegam as falhas do pool (BrokenProcessPool, OOM...)
+    if future.cancelled():
+        error = 'tarefa cancelada'
+    else:
+        exc = future.exception()
+        if exc is None:
+            return
+        if isinstance(exc, BrokenProcessPool):
+            _discard_executor(executor)
+        error = str(exc) or type(exc).__name__
+    write_status(job_id, status='error', error=error, finished_at=time.time())
+
+
+def get_job(job_id):
+    # O id vem da URL: só aceitamos o formato gerado por submit_job
+    if len(job_id) != 32 or any(c not in '0123456789abcdef' for c in job_id):
+        return None
+    status = read_status(job_id)
+    if status and status['status'] in ('queued', 'running'):
+        since = status.get('started_at') or status.get('created_at', 0)
+        if time.time() - since > _config['timeout']:
+            status = write_status(job_id, status='error', error='tempo esgotado', finished_at=time.time())
+    return status
+
+
+def result_path(job_id):
+    return os.path.join(job_dir(job_id), 'result')
+
+
+def cleanup_old_jobs():
+    limit = time.time() - JOB_TTL_SECONDS
+    for name in os.listdir(_config['dir']):
+        status = read_status(name)
+        if status and status.get('created_at', 0) < limit:
+            shutil.rmtree(job_dir(name), ignore_errors=True)
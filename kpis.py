@@ -0,0 +1,86 @@
+import time
+from datetime import date
+from threading import Lock
+from sqlalchemy import func
+
+from models import db, Student, FeeRollup, TableVersion
+from database import primary
+
+# Ordem dos meses usada nos gráficos e na geração de mensalidades
+MESES_ORDEM = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho', 'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
+
+# --- CACHE DO SNAPSHOT DE KPIs ---
+# O dashboard lê daqui. O snapshot guarda as versões (TableVersion, ver
+# httpcache.py) de fee_rollup e student com que foi calculado: qualquer commit
+# nessas tabelas, em qualquer worker do gunicorn, muda a versão e a próxima
+# visita recalcula. Versões e cálculo vêm sempre do banco principal (uma
+# réplica atrasada guardaria um valor velho). KPI_TTL limita a idade mesmo
+# sem escritas (ex.: virada do ano). invalidate_kpis() descarta o snapshot
+# deste processo na hora.
+KPI_TABLES = ('fee_rollup', 'student')
+KPI_TTL = 300  # segundos
+
+_snapshot = None  # (versões, calculado em, valores)
+_generation = 0
+_lock = Lock()
+
+
+def invalidate_kpis():
+    global _snapshot, _generation
+    with _lock:
+        _snapshot = None
+        _generation += 1
+
+
+def compute_kpis():
+    # Mensalidades vêm do resumo FeeRollup (ver rollup.py), não de Fee
+    ano = date.today().year
+
+    # 1) Contagem e soma por status (pago / pendente), todos os anos
+    por_status = dict(
+        (status, (count or 0, total or 0))
+        for status, count, total in db.session.query(
+            FeeRollup.status, func.sum(FeeRollup.count), func.sum(FeeRollup.total)
+        ).group_by(FeeRollup.status)
+    )
+
+    # 2) Receita do ano corrente (apenas pagos)
+    receita_ano = db.session.query(func.sum(FeeRollup.total)) \
+        .filter(FeeRollup.status == 'pago', FeeRollup.year == ano).scalar()
+
+    # 3) Alunos matriculados (gráficos por mês/turma saem de charts.py)
+    student_count = db.session.query(func.count(Student.id)).scalar()
+
+    return {
+        'student_count': student_count or 0,
+        'paid': por_status.get('pago', (0, 0))[0],
+        'pending': por_status.get('pendente', (0, 0))[0],
+        'receita_total': receita_ano or 0,
+        'pendente_total': por_status.get('pendente', (0, 0))[1],
+    }
+
+
+def kpi_versions():
+    return tuple(sorted(
+        db.session.query(TableVersion.name, TableVersion.version)
+        .filter(TableVersion.name.in_(KPI_TABLES))
+    ))
+
+
+def get_kpis():
+    global _snapshot
+    with primary():
+        versions = kpi_versions()
+        with _lock:
+            if (_snapshot is not None and _snapshot[0] == versions
+                    and time.monotonic() - _snapshot[1] < KPI_TTL):
+                return _snapshot[2]
+            geracao = _generation
+
+        snapshot = compute_kpis()
+
+    with _lock:
+        # Se houve escrita enquanto calculávamos, não guardamos um valor velho
+        if geracao == _generation:
+            _snapshot = (versions, time.monotonic(), snapshot)
+    return snapshot
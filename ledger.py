@@ -0,0 +1,97 @@
+from datetime import datetime
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import contains_eager
+
+from models import Student, Fee
+
+# --- PAGINAÇÃO DO FINANCEIRO (KEYSET) ---
+# Em vez de OFFSET, cada página começa depois do último (due_date, id) visto.
+# Assim o custo de uma página não cresce com a quantidade de anos no banco.
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(fee):
+    due = fee.due_date.isoformat() if fee.due_date else ''
+    return f'{due}_{fee.id}'
+
+
+def decode_cursor(cursor):
+    # Formato: "AAAA-MM-DD_id" (data vazia quando o vencimento é nulo)
+    if not cursor:
+        return None
+    try:
+        due, fee_id = cursor.rsplit('_', 1)
+        due_date = datetime.strptime(due, '%Y-%m-%d').date() if due else None
+        return due_date, int(fee_id)
+    except ValueError:
+        return None
+
+
+def ledger_query(status=None, month=None, year=None, class_id=None, student_id=None):
+    # Uma única consulta com aluno, turma e responsável já carregados (sem N+1 no template)
+    query = Fee.query \
+        .join(Fee.student) \
+        .outerjoin(Student.school_class) \
+        .outerjoin(Student.guardian) \
+        .options(
+            contains_eager(Fee.student).contains_eager(Student.school_class),
+            contains_eager(Fee.student).contains_eager(Student.guardian),
+        )
+
+    if status:
+        query = query.filter(Fee.status == status)
+    if month:
+        query = query.filter(Fee.month == month)
+    if year:
+        # Ano de referência (o mesmo do dashboard e do resumo); índice ix_fee_year_month
+        query = query.filter(Fee.year == year)
+    if class_id:
+        query = query.filter(Student.class_id == class_id)
+    if student_id:
+        query = query.filter(Fee.student_id == student_id)
+    return query
+
+
+def fetch_page(query, cursor=None, limit=PAGE_SIZE):
+    limit = max(1, min(limit or PAGE_SIZE, MAX_PAGE_SIZE))
+    position = decode_cursor(cursor)
+
+    if position:
+        last_due, last_id = position
+        if last_due is None:
+            # Já estamos na parte final (vencimentos nulos vêm por último)
+            query = query.filter(Fee.due_date.is_(None), Fee.id < last_id)
+        else:
+            query = query.filter(or_(
+                Fee.due_date < last_due,
+                and_(Fee.due_date == last_due, Fee.id < last_id),
+                Fee.due_date.is_(None),
+            ))
+
+    rows = query.order_by(Fee.due_date.desc().nulls_last(), Fee.id.desc()) \
+        .limit(limit + 1).all()
+
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def fee_to_dict(fee):
+    student = fee.student
+    guardian = student.guardian if student else None
+    return {
+        'id': fee.id,
+        'student_id': fee.student_id,
+        'student_name': student.name if student else None,
+        'class_id': student.class_id if student else None,
+        'class_name': student.school_class.name if student and student.school_class else None,
+        'guardian_name': guardian.name if guardian else None,
+        'guardian_phone': guardian.phone if guardian else None,
+        'month': fee.month,
+        'year': fee.year,
+        'amount': fee.amount,
+        'status': fee.status,
+        'due_date': fee.due_date.isoformat() if fee.due_date else None,
+        'payment_date': fee.payment_date.isoformat() if fee.payment_date else None,
+    }
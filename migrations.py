@@ -0,0 +1,205 @@
+from datetime import date
+from sqlalchemy import inspect, text, extract, func, select, update, delete, case, and_
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Fee, Class, FeeRollup, StatementLine, ReminderLog
+from utils import normalizar
+from search import setup_search_backend, index_is_empty, rebuild_search_index
+from rollup import rollup_is_empty, rebuild_rollup
+from httpcache import ensure_version_rows
+
+# --- MIGRAÇÕES SIMPLES DE INICIALIZAÇÃO ---
+# db.create_all() só cria tabelas novas; não adiciona colunas nem índices
+# em tabelas que já existem. Este passo completa o que falta, é idempotente
+# e pode rodar em todo boot (SQLite local ou PostgreSQL no Render).
+
+# Colunas adicionadas depois da criação original das tabelas
+NEW_COLUMNS = [
+    ('fee', 'year', 'INTEGER'),
+    ('student', 'class_id', 'INTEGER REFERENCES class (id)'),
+    ('reminder_log', 'claimed_at', 'TIMESTAMP'),
+]
+
+
+def add_missing_columns():
+    inspector = inspect(db.engine)
+    for table, column, ddl_type in NEW_COLUMNS:
+        existing = [c['name'] for c in inspector.get_columns(table)]
+        if column not in existing:
+            with db.engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl_type}'))
+            print(f'Migração: coluna {table}.{column} adicionada')
+
+
+def backfill_fee_year():
+    # Mensalidades antigas não tinham ano: usamos o ano do vencimento (sem
+    # vencimento, o ano atual). Depois a coluna passa a NOT NULL: com ano
+    # nulo o índice único aluno/mês/ano não barraria duplicatas.
+    updated = Fee.query.filter(Fee.year.is_(None)) \
+        .update({Fee.year: func.coalesce(extract('year', Fee.due_date), date.today().year)},
+                synchronize_session=False)
+    db.session.commit()
+    if updated:
+        print(f'Migração: ano preenchido em {updated} mensalidades')
+    year = next(c for c in inspect(db.engine).get_columns('fee') if c['name'] == 'year')
+    # SQLite não altera colunas existentes; bancos criados do zero já vêm NOT NULL
+    if year['nullable'] and db.engine.dialect.name == 'postgresql':
+        with db.engine.begin() as conn:
+            conn.execute(text('ALTER TABLE fee ALTER COLUMN year SET NOT NULL'))
+        print('Migração: fee.year agora é NOT NULL')
+
+
+def migrate_student_classes():
+    # Alunos antigos guardavam só o nome da turma (student.class_name, texto
+    # livre). Liga cada nome à turma cadastrada com o mesmo nome (a do ano
+    # mais recente) ou cria a turma se ela não existir. A coluna antiga fica
+    # no banco, mas é esvaziada em quem foi ligado: roda uma vez só, senão a
+    # cada deploy os alunos de uma turma excluída voltariam para ela.
+    columns = [c['name'] for c in inspect(db.engine).get_columns('student')]
+    if 'class_name' not in columns:
+        return False
+    # Bancos ligados por versões anteriores desta migração
+    db.session.execute(text('UPDATE student SET class_name = NULL WHERE class_id IS NOT NULL AND class_name IS NOT NULL'))
+    db.session.commit()
+    names = [name for name, in db.session.execute(text(
+        "SELECT DISTINCT class_name FROM student WHERE class_id IS NULL AND class_name IS NOT NULL AND class_name <> ''"
+    ))]
+    if not names:
+        return False
+
+    classes = {}
+    for turma in Class.query.order_by(Class.year, Class.id):
+        classes[normalizar(turma.name)] = turma  # o ano mais recente fica por último
+    created = 0
+    linked = 0
+    for name in names:
+        turma = classes.get(normalizar(name))
+        if turma is None:
+            turma = Class(name=name.strip(), year=date.today().year)
+            db.session.add(turma)
+            db.session.flush()
+            classes[normalizar(name)] = turma
+            created += 1
+        linked += db.session.execute(
+            text('UPDATE student SET class_id = :class_id, class_name = NULL WHERE class_id IS NULL AND class_name = :name'),
+            {'class_id': turma.id, 'name': name}
+        ).rowcount
+    db.session.commit()
+    print(f'Migração: {linked} alunos ligados às turmas ({created} turmas criadas)')
+    return linked > 0
+
+
+def recreate_fee_rollup():
+    # O resumo passou de class_name para class_id: a tabela antiga é
+    # descartada e recalculada (ver upgrade_schema)
+    columns = [c['name'] for c in inspect(db.engine).get_columns('fee_rollup')]
+    if 'class_id' not in columns:
+        FeeRollup.__table__.drop(db.engine)
+        FeeRollup.__table__.create(db.engine)
+        print('Migração: resumo financeiro recriado por turma (class_id)')
+
+
+def merge_duplicate_fees():
+    # Bancos antigos podem ter a mesma mensalidade repetida (gerar o ano duas
+    # vezes inseria tudo de novo), o que impede o índice único aluno/mês/ano.
+    # Antes de criá-lo, fica uma por aluno/mês/ano: a paga, senão a de menor
+    # id. Conciliações apontam para a que ficou; lembretes também, quando não
+    # repetem um (tipo, dia) que ela já tem. Tudo numa transação.
+    indexes = {ix['name'] for ix in inspect(db.engine).get_indexes('fee')}
+    if 'uq_fee_student_month_year' in indexes:
+        return False
+    key = (Fee.student_id, Fee.month, Fee.year)
+    dup = select(*key).group_by(*key).having(func.count(Fee.id) > 1).subquery()
+    rows = db.session.query(Fee.id, *key) \
+        .join(dup, and_(Fee.student_id == dup.c.student_id, Fee.month == dup.c.month, Fee.year == dup.c.year)) \
+        .order_by(*key, case((Fee.status == 'pago', 0), else_=1), Fee.id).all()
+    keeper = {}   # (aluno, mês, ano) -> id mantido
+    merged = {}   # id removido -> id mantido
+    for fee_id, student_id, month, year in rows:
+        kept = keeper.setdefault((student_id, month, year), fee_id)
+        if kept != fee_id:
+            merged[fee_id] = kept
+    if not merged:
+        return False
+
+    removed = list(merged)
+    for i in range(0, len(removed), 500):
+        batch = {fee_id: merged[fee_id] for fee_id in removed[i:i + 500]}
+        db.session.execute(
+            update(StatementLine).where(StatementLine.fee_id.in_(batch))
+            .values(fee_id=case(batch, value=StatementLine.fee_id))
+            .execution_options(synchronize_session=False)
+        )
+        logs = db.session.query(ReminderLog.id, ReminderLog.fee_id, ReminderLog.kind, ReminderLog.sent_on) \
+            .filter(ReminderLog.fee_id.in_(list(batch) + list(set(batch.values())))).order_by(ReminderLog.id).all()
+        taken = {(fee_id, kind, sent_on) for _, fee_id, kind, sent_on in logs if fee_id not in batch}
+        repoint, drop = {}, []
+        for log_id, fee_id, kind, sent_on in logs:
+            if fee_id not in batch:
+                continue
+            target = (batch[fee_id], kind, sent_on)
+            if target in taken:
+                drop.append(log_id)
+            else:
+                taken.add(target)
+                repoint[log_id] = batch[fee_id]
+        if repoint:
+            db.session.execute(
+                update(ReminderLog).where(ReminderLog.id.in_(repoint))
+                .values(fee_id=case(repoint, value=ReminderLog.id))
+                .execution_options(synchronize_session=False)
+            )
+        if drop:
+            db.session.execute(delete(ReminderLog).where(ReminderLog.id.in_(drop))
+                               .execution_options(synchronize_session=False))
+        db.session.execute(delete(Fee).where(Fee.id.in_(batch)).execution_options(synchronize_session=False))
+    db.session.commit()
+    print(f'Migração: {len(merged)} mensalidades repetidas removidas '
+          f'({len(set(merged.values()))} aluno/mês/ano mantidos)')
+    return True
+
+
+def create_missing_indexes():
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            # Cada índice na sua própria transação: se um índice comum falhar, os
+            # outros ainda são criados. Os únicos não podem faltar: os INSERT ...
+            # ON CONFLICT (ex.: billing.fee_insert) dependem deles.
+            try:
+                with db.engine.begin() as conn:
+                    index.create(conn)
+                print(f'Migração: índice {index.name} criado')
+            except SQLAlchemyError as e:
+                if index.unique:
+                    raise RuntimeError(
+                        f'Migração: não foi possível criar o índice único {index.name} '
+                        f'(há linhas duplicadas em {table.name}?): {e}'
+                    ) from e
+                print(f'Migração: não foi possível criar {index.name}: {e.__class__.__name__}')
+
+
+def upgrade_schema():
+    db.create_all()
+    add_missing_columns()
+    backfill_fee_year()
+    classes_linked = migrate_student_classes()
+    recreate_fee_rollup()
+    fees_merged = merge_duplicate_fees()
+    create_missing_indexes()
+    # Versões usadas nos ETags das páginas (ver httpcache.py)
+    ensure_version_rows()
+    # Índice de busca: FTS5/trigramas conforme o banco; preenchido na primeira vez
+    setup_search_backend()
+    if classes_linked or index_is_empty():
+        rebuild_search_index()
+        print('Migração: índice de busca atualizado' if classes_linked else 'Migração: índice de busca criado')
+    # Resumo financeiro: calculado de uma vez em bancos que já tinham mensalidades
+    # (e de novo quando alunos mudaram de turma ou mensalidades foram unidas)
+    if classes_linked or fees_merged or rollup_is_empty():
+        rebuild_rollup()
+        print('Migração: resumo financeiro recalculado' if classes_linked or fees_merged
+              else 'Migração: resumo financeiro criado')
@@ -2,7 +2,10 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
 
-db = SQLAlchemy()
+from database import RoutingSession
+
+# RoutingSession manda as leituras das rotas @read_only para a réplica (ver database.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -23,19 +26,39 @@ class Student(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(150), nullable=False)
     birth_date = db.Column(db.Date)
-    class_name = db.Column(db.String(50))
+    # Turma por chave (antes era o nome em texto, class_name; ver migrations.py)
+    class_id = db.Column(db.Integer, db.ForeignKey('class.id'), nullable=True)
     guardian_id = db.Column(db.Integer, db.ForeignKey('guardian.id'), nullable=True)
     fees = db.relationship('Fee', backref='student', lazy=True)
 
+    __table_args__ = (
+        # Alunos de uma turma (lista da turma, geração de mensalidades, resumo)
+        db.Index('ix_student_class_id', 'class_id'),
+    )
+
 class Fee(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
     month = db.Column(db.String(50), nullable=False)
+    year = db.Column(db.Integer, nullable=False) # Ano de referência (junto com month)
     amount = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(20), default='pendente')
     due_date = db.Column(db.Date)
     payment_date = db.Column(db.Date)
 
+    # Índices criados também em bancos já existentes (ver migrations.py)
+    __table_args__ = (
+        # Uma mensalidade por aluno/mês/ano. Também atende buscas por student_id.
+        db.Index('uq_fee_student_month_year', 'student_id', 'month', 'year', unique=True),
+        # Agregações do dashboard (status + mês) e pendências por vencimento
+        db.Index('ix_fee_status_month', 'status', 'month'),
+        db.Index('ix_fee_status_due_date', 'status', 'due_date'),
+        # Ordenação/paginação do extrato financeiro
+        db.Index('ix_fee_due_date_id', 'due_date', 'id'),
+        # Recálculo de um mês/ano do resumo financeiro (ver rollup.py)
+        db.Index('ix_fee_year_month', 'year', 'month'),
+    )
+
     # ... classes anteriores (User, Guardian, Student, Fee) ...
 
 class Teacher(db.Model):
@@ -49,4 +72,74 @@ class Class(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False) # Ex: Maternal II
     year = db.Column(db.Integer, nullable=False)      # Ex: 2024
-    teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id'), nullable=True)
\ No newline at end of file
+    teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id'), nullable=True)
+    students = db.relationship('Student', backref='school_class', lazy=True)
+
+    @property
+    def label(self):
+        # Turmas com o mesmo nome em anos diferentes: "Maternal II (2024)"
+        return f'{self.name} ({self.year})'
+
+class SearchEntry(db.Model):
+    # Índice de busca de alunos e responsáveis (mantido por search.py).
+    # body guarda o texto já normalizado: minúsculas, sem acentos, CPF/telefone só com dígitos.
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False) # student, guardian
+    ref_id = db.Column(db.Integer, nullable=False)
+    label = db.Column(db.String(300), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+
+    __table_args__ = (
+        db.Index('uq_search_entry_kind_ref', 'kind', 'ref_id', unique=True),
+    )
+
+class FeeRollup(db.Model):
+    # Resumo das mensalidades por ano/mês/turma/status (mantido por rollup.py).
+    # Sem ano ou sem turma ficam como 0 para a chave única funcionar.
+    id = db.Column(db.Integer, primary_key=True)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.String(50), nullable=False)
+    class_id = db.Column(db.Integer, nullable=False, default=0)
+    status = db.Column(db.String(20), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Float, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('uq_fee_rollup_key', 'year', 'month', 'class_id', 'status', unique=True),
+    )
+
+class StatementLine(db.Model):
+    # Linhas de extrato bancário já conciliadas (ver reconciliation.py).
+    # fingerprint identifica a linha (FITID do OFX ou hash dos dados do CSV):
+    # enviar o mesmo extrato de novo não paga nada duas vezes.
+    id = db.Column(db.Integer, primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False, unique=True)
+    fee_id = db.Column(db.Integer, db.ForeignKey('fee.id'), nullable=True)
+    posted_date = db.Column(db.Date)
+    amount = db.Column(db.Float, nullable=False)
+    description = db.Column(db.String(300))
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+class TableVersion(db.Model):
+    # Versão de cada tabela, incrementada no commit de qualquer escrita nela
+    # (ver httpcache.py). Fica no banco para valer para todos os workers.
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+class ReminderLog(db.Model):
+    # Lembretes de mensalidade enviados (ver reminders.py). A chave única
+    # (mensalidade, tipo, dia) impede que duas execuções mandem o mesmo aviso.
+    id = db.Column(db.Integer, primary_key=True)
+    fee_id = db.Column(db.Integer, db.ForeignKey('fee.id'), nullable=False)
+    guardian_id = db.Column(db.Integer, db.ForeignKey('guardian.id'), nullable=True)
+    kind = db.Column(db.String(20), nullable=False) # upcoming, overdue
+    sent_on = db.Column(db.Date, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending') # pending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.String(300))
+    claimed_at = db.Column(db.DateTime) # quando virou "pending" (ver reminders.claim)
+
+    __table_args__ = (
+        db.Index('uq_reminder_log_fee_kind_day', 'fee_id', 'kind', 'sent_on', unique=True),
+    )
@@ -0,0 +1,182 @@
+import hashlib
+import zipfile
+from collections import OrderedDict
+from datetime import datetime
+from threading import Lock
+
+from utils import remover_acentos
+
+# --- RECIBOS EM PDF ---
+# O desenho de um recibo fica em draw_receipt(), que escreve numa página do
+# FPDF recebido. Assim o recibo avulso e o lote (várias páginas no mesmo
+# documento) usam exatamente o mesmo layout.
+
+
+def receipt_data(fee):
+    student = fee.student
+
+    # 1. Segurança: Verifica se o aluno e responsável existem
+    guardian_name = "Não informado"
+    if student and student.guardian:
+        guardian_name = student.guardian.name
+
+    # 2. Segurança: Verifica se a data de pagamento existe
+    pay_date_str = "N/D"
+    if fee.payment_date:
+        pay_date_str = fee.payment_date.strftime('%d/%m/%Y')
+
+    return {
+        'id': fee.id,
+        'student_name': student.name if student else '',
+        'guardian_name': guardian_name,
+        'month': fee.month,
+        'year': fee.year,
+        'amount': fee.amount,
+        'pay_date': pay_date_str,
+        'issue_date': datetime.now().strftime('%d/%m/%Y'),
+    }
+
+
+def new_document():
+    # fpdf só é importado no primeiro recibo: deixa o boot dos workers mais rápido
+    from fpdf import FPDF
+
+    pdf = FPDF()
+    pdf.set_draw_color(200, 200, 200)
+    return pdf
+
+
+def draw_receipt(pdf, data):
+    pdf.add_page()
+
+    # Cabeçalho
+    pdf.set_font('Helvetica', 'B', 16)
+    pdf.cell(200, 10, remover_acentos('Escola Renascer'), ln=True, align='C')
+
+    pdf.set_font('Helvetica', 'I', 12)
+    pdf.cell(200, 6, remover_acentos('Comprovante de Pagamento'), ln=True, align='C')
+    pdf.ln(10)
+
+    pdf.line(10, 40, 200, 40)
+    pdf.ln(10)
+
+    # Dados do Recibo
+    pdf.set_font('Helvetica', '', 12)
+    pdf.cell(200, 8, f'ID do Pagamento: #{data["id"]}', ln=True)
+    pdf.cell(200, 8, f'Data de Emissao: {data["issue_date"]}', ln=True)
+    pdf.cell(200, 8, f'Data do Pagamento: {data["pay_date"]}', ln=True)
+    pdf.ln(5)
+
+    reference = data['month'] if not data['year'] else f'{data["month"]}/{data["year"]}'
+    for label, value in [
+        ('Aluno(a):', data['student_name']),
+        ('Responsavel:', data['guardian_name']),
+        (None, None),
+        ('Referencia:', reference),
+        ('Valor Pago:', f'R$ {data["amount"]:.2f}'),
+    ]:
+        if label is None:
+            pdf.ln(10)
+            continue
+        pdf.set_font('Helvetica', 'B', 12)
+        pdf.cell(40, 8, remover_acentos(label), ln=False)
+        pdf.set_font('Helvetica', '', 12)
+        pdf.cell(160, 8, remover_acentos(value), ln=True)
+
+    pdf.ln(40)
+    pdf.line(60, 200, 150, 200)
+    pdf.set_font('Helvetica', 'I', 10)
+    pdf.cell(200, 8, remover_acentos('Assinatura da Direcao'), ln=True, align='C')
+    pdf.set_font('Helvetica', '', 8)
+    pdf.cell(200, 8, remover_acentos('Documento emitido eletronicamente.'), ln=True, align='C')
+
+
+def receipt_filename(data):
+    return f'recibo_{data["month"]}_{data["student_name"]}.pdf'
+
+
+# --- CACHE DE RECIBOS RENDERIZADOS ---
+# A chave é o hash de tudo que aparece no PDF (inclusive a data de emissão),
+# então qualquer alteração na mensalidade, no aluno ou no responsável gera
+# uma chave nova e o recibo antigo simplesmente deixa de ser usado.
+CACHE_SIZE = 256
+_cache = OrderedDict()
+_cache_lock = Lock()
+
+
+def cache_key(data):
+    raw = '|'.join(str(data[k]) for k in sorted(data))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def render_receipt(data):
+    key = cache_key(data)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    pdf = new_document()
+    draw_receipt(pdf, data)
+    pdf_bytes = bytes(pdf.output())
+
+    with _cache_lock:
+        _cache[key] = pdf_bytes
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return pdf_bytes
+
+
+def render_batch_pdf(items):
+    # Um documento, uma página por recibo
+    pdf = new_document()
+    for data in items:
+        draw_receipt(pdf, data)
+    return bytes(pdf.output())
+
+
+class _ZipStream:
+    # Destino "não pesquisável" para o ZipFile: acumula e entrega em pedaços
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, b):
+        self.chunks.append(bytes(b))
+        self.position += len(b)
+        return len(b)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_batch_zip(items):
+    # Gera o ZIP aos poucos: cada recibo é escrito e enviado em seguida
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, mode='w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for data in items:
+            zf.writestr(f'{data["id"]}_{remover_acentos(receipt_filename(data))}', render_receipt(data))
+            yield stream.drain()
+    yield stream.drain()
+
+
+# --- FUNÇÕES PARA A FILA DE TAREFAS (jobs.py) ---
+# Rodam em outro processo: recebem só dicionários de receipt_data().
+
+def write_batch_pdf(path, items):
+    with open(path, 'wb') as f:
+        f.write(render_batch_pdf(items))
+
+
+def write_batch_zip(path, items):
+    with open(path, 'wb') as f:
+        for chunk in stream_batch_zip(items):
+            f.write(chunk)
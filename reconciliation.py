@@ -0,0 +1,295 @@
+import hashlib
+import re
+from collections import defaultdict
+from datetime import date, datetime
+from sqlalchemy import update, case, insert
+
+from models import db, Student, Guardian, Fee, Class, StatementLine
+from kpis import MESES_ORDEM
+from importer import read_csv, parse_date, parse_amount, batches, MESES
+from rollup import refresh_rollup
+from utils import normalizar, somente_digitos
+
+# --- BAIXA DE PAGAMENTOS EM LOTE E CONCILIAÇÃO BANCÁRIA ---
+# O extrato (CSV ou OFX) é lido linha a linha e cada crédito é casado com uma
+# mensalidade pendente pelo aluno (CPF do responsável, nome do aluno ou do
+# responsável), pelo valor e, se informado, pelo mês de referência. As
+# mensalidades pendentes são carregadas uma única vez em memória.
+#
+# As baixas são gravadas em lotes: um único UPDATE ... WHERE id IN (...) por
+# lote, só em mensalidades ainda pendentes. Cada linha conciliada fica em
+# StatementLine; enviar o mesmo extrato de novo não paga nada duas vezes.
+#
+# CSV: data; valor; descricao; documento (opcional); aluno; turma; cpf; referencia
+# OFX: blocos <STMTTRN> (DTPOSTED, TRNAMT, FITID, NAME, MEMO)
+
+MAX_NAME_WORDS = 6
+
+CSV_COLUMNS = ['data', 'valor', 'descricao', 'documento', 'aluno', 'turma', 'cpf', 'referencia']
+
+
+class ReconciliationReport:
+    def __init__(self):
+        self.lines = 0
+        self.paid = 0
+        self.already = 0    # linhas de extratos já conciliados antes
+        self.ignored = 0    # débitos (valores negativos ou zero)
+        self.total = 0.0
+        self.unmatched = []  # (linha, data, valor, descrição, motivo)
+
+    def miss(self, line, reason):
+        self.unmatched.append((line['number'], line['date'], line['amount'], line['description'], reason))
+
+
+# --- LEITURA DO EXTRATO ---
+
+def fingerprint(*parts):
+    return hashlib.sha256('|'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+
+
+def read_statement_csv(file_storage):
+    seen = defaultdict(int)
+    for number, row in read_csv(file_storage):
+        try:
+            posted = parse_date(row.get('data', ''))
+            amount = parse_amount(row.get('valor', ''))
+        except ValueError as e:
+            yield {'number': number, 'error': str(e), 'date': None, 'amount': 0,
+                   'description': row.get('descricao') or row.get('historico', '')}
+            continue
+        description = row.get('descricao') or row.get('historico', '')
+        document = row.get('documento', '')
+        # Duas linhas idênticas no mesmo extrato são pagamentos diferentes
+        key = (posted, amount, description, document)
+        seen[key] += 1
+        yield {
+            'number': number,
+            'fingerprint': fingerprint('csv', *key, seen[key]),
+            'date': posted,
+            'amount': amount,
+            'description': description,
+            'student': row.get('aluno', ''),
+            'class_name': row.get('turma', ''),
+            'cpf': row.get('cpf', ''),
+            'reference': row.get('referencia', ''),
+        }
+
+
+OFX_TRANSACTION = re.compile(r'<STMTTRN>(.*?)(?:</STMTTRN>|(?=<STMTTRN>)|(?=</BANKTRANLIST>))', re.S | re.I)
+OFX_TAG = re.compile(r'<(\w+)>([^<\r\n]*)')
+
+
+def read_statement_ofx(file_storage):
+    raw = file_storage.read()
+    try:
+        content = raw.decode('utf-8')
+    except UnicodeDecodeError:
+        content = raw.decode('cp1252')  # OFX dos bancos brasileiros (CHARSET:1252)
+
+    for number, block in enumerate(OFX_TRANSACTION.findall(content), start=1):
+        tags = {tag.upper(): value.strip() for tag, value in OFX_TAG.findall(block)}
+        description = ' '.join(filter(None, [tags.get('NAME'), tags.get('MEMO')]))
+        try:
+            posted = datetime.strptime(tags.get('DTPOSTED', '')[:8], '%Y%m%d').date()
+            amount = parse_amount(tags.get('TRNAMT', ''))
+        except ValueError:
+            yield {'number': number, 'error': 'data ou valor inválido', 'date': None, 'amount': 0,
+                   'description': description}
+            continue
+        yield {
+            'number': number,
+            'fingerprint': fingerprint('ofx', tags.get('FITID') or (posted, amount, description, number)),
+            'date': posted,
+            'amount': amount,
+            'description': description,
+            'student': '',
+            'class_name': '',
+            'cpf': '',
+            'reference': '',
+        }
+
+
+def read_statement(file_storage):
+    name = (file_storage.filename or '').lower()
+    if name.endswith('.ofx'):
+        return read_statement_ofx(file_storage)
+    return read_statement_csv(file_storage)
+
+
+REFERENCE_NUMBER = re.compile(r'(?<![\d/-])(\d{1,2})[/-](\d{4})\b')  # não pega datas dd/mm/aaaa
+
+
+def parse_reference(text, default_year):
+    # "03/2025", "marco/2025", "Ref. Março" -> ('Março', 2025)
+    text = normalizar(text)
+    match = REFERENCE_NUMBER.search(text)
+    if match and 1 <= int(match.group(1)) <= 12:
+        return MESES_ORDEM[int(match.group(1)) - 1], int(match.group(2))
+    for word in re.findall(r'[a-z]+|\d{4}', text):
+        if word in MESES:
+            year = re.search(r'\b(20\d{2})\b', text)
+            return MESES[word], int(year.group(1)) if year else default_year
+    return None
+
+
+# --- MENSALIDADES PENDENTES ---
+
+class PendingFees:
+    def __init__(self):
+        # Uma consulta: todas as pendentes com aluno e responsável
+        self.by_student = defaultdict(list)
+        self.students_by_cpf = defaultdict(set)
+        self.students_by_name = defaultdict(set)
+        names = {}
+        rows = db.session.query(
+            Fee.id, Fee.student_id, Fee.month, Fee.year, Fee.amount, Fee.due_date,
+            Student.name, Class.name, Guardian.name, Guardian.cpf
+        ).join(Student, Fee.student_id == Student.id) \
+         .outerjoin(Class, Student.class_id == Class.id) \
+         .outerjoin(Guardian, Student.guardian_id == Guardian.id) \
+         .filter(Fee.status == 'pendente') \
+         .order_by(Fee.due_date, Fee.id)
+
+        for fee_id, student_id, month, year, amount, due, name, class_name, g_name, cpf in rows:
+            self.by_student[student_id].append((fee_id, month, year, amount, due))
+            if somente_digitos(cpf):
+                self.students_by_cpf[somente_digitos(cpf)].add(student_id)
+            for key in (normalizar(name), normalizar(g_name)):
+                if key:
+                    self.students_by_name[key].add(student_id)
+            names[student_id] = (normalizar(name), normalizar(class_name))
+        self.names = names
+        self.claimed = set()
+
+    def candidates(self, line):
+        cpf = somente_digitos(line['cpf'])
+        if not cpf:
+            found = re.search(r'\b\d{3}\.?\d{3}\.?\d{3}-?\d{2}\b', line['description'])
+            cpf = somente_digitos(found.group(0)) if found else ''
+        if cpf and cpf in self.students_by_cpf:
+            return self.students_by_cpf[cpf]
+
+        if line['student']:
+            students = self.students_by_name.get(normalizar(line['student']), set())
+            if line['class_name']:
+                students = {s for s in students if self.names[s][1] == normalizar(line['class_name'])}
+            return students
+
+        # Sem CPF nem aluno: procura nomes de alunos/responsáveis na descrição,
+        # testando cada sequência de palavras (até MAX_NAME_WORDS) no índice
+        words = normalizar(line['description']).split()
+        students = set()
+        for start in range(len(words)):
+            for end in range(start + 1, min(start + MAX_NAME_WORDS, len(words)) + 1):
+                students |= self.students_by_name.get(' '.join(words[start:end]), set())
+        return students
+
+    def match(self, line):
+        # Devolve (fee_id, None) ou (None, motivo)
+        students = self.candidates(line)
+        if not students:
+            return None, 'aluno não identificado'
+        reference = parse_reference(line['reference'] or line['description'], line['date'].year)
+
+        options = []
+        for student_id in students:
+            for fee_id, month, year, amount, due in self.by_student[student_id]:
+                if fee_id in self.claimed or abs(amount - line['amount']) >= 0.005:
+                    continue
+                if reference and (month, year) != reference:
+                    continue
+                options.append((due or date.max, fee_id, student_id))
+        if not options:
+            return None, 'nenhuma mensalidade pendente com este valor' + (' no mês de referência' if reference else '')
+        if len({student_id for _, _, student_id in options}) > 1:
+            return None, 'mais de um aluno possível (informe aluno ou referência)'
+
+        # Mesmo aluno: quita a mais antiga
+        fee_id = min(options)[1]
+        self.claimed.add(fee_id)
+        return fee_id, None
+
+
+# --- GRAVAÇÃO ---
+
+def apply_payments(payments):
+    # payments: {fee_id: data do pagamento}. Um UPDATE por chamada, só em
+    # mensalidades pendentes; devolve os ids que foram realmente baixados.
+    if not payments:
+        return set()
+    ids = list(payments)
+    slices = db.session.query(Fee.year, Fee.month, Student.class_id) \
+        .join(Student, Fee.student_id == Student.id) \
+        .filter(Fee.id.in_(ids), Fee.status == 'pendente').distinct().all()
+
+    paid = set(db.session.scalars(
+        update(Fee)
+        .where(Fee.id.in_(ids), Fee.status == 'pendente')
+        .values(status='pago', payment_date=case(payments, value=Fee.id))
+        .returning(Fee.id)
+        .execution_options(synchronize_session=False)
+    ))
+    # Ordem fixa: os locks dos pedaços (ver rollup.py) sempre na mesma sequência
+    for year, month, class_id in sorted(slices, key=lambda s: (s[0] or 0, s[1], s[2] or 0)):
+        refresh_rollup(year, month, class_id)
+    return paid
+
+
+def pay_fees(fee_ids, payment_date):
+    # Baixa manual de várias mensalidades (tela do financeiro). Devolve
+    # (baixadas agora, que já estavam pagas); ids inexistentes não contam.
+    paid = already = 0
+    for batch in batches(sorted(set(fee_ids))):
+        done = apply_payments({fee_id: payment_date for fee_id in batch})
+        already += db.session.query(Fee.id) \
+            .filter(Fee.id.in_(batch), Fee.status == 'pago', Fee.id.notin_(done)).count()
+        db.session.commit()
+        paid += len(done)
+    return paid, already
+
+
+def reconcile_statement(file_storage):
+    report = ReconciliationReport()
+    lines = list(read_statement(file_storage))
+    known = set()
+    fingerprints = [line['fingerprint'] for line in lines if 'fingerprint' in line]
+    for batch in batches(fingerprints):
+        known.update(db.session.scalars(
+            db.select(StatementLine.fingerprint).where(StatementLine.fingerprint.in_(batch))
+        ))
+
+    pending = PendingFees()
+    for batch in batches(lines):
+        matched = {}  # fee_id -> linha
+        for line in batch:
+            report.lines += 1
+            if 'error' in line:
+                report.miss(line, line['error'])
+            elif line['amount'] <= 0:
+                report.ignored += 1
+            elif line['fingerprint'] in known:
+                report.already += 1
+            else:
+                known.add(line['fingerprint'])
+                fee_id, reason = pending.match(line)
+                if fee_id:
+                    matched[fee_id] = line
+                else:
+                    report.miss(line, reason)
+
+        paid = apply_payments({fee_id: line['date'] for fee_id, line in matched.items()})
+        for fee_id, line in matched.items():
+            if fee_id not in paid:
+                report.miss(line, 'mensalidade já estava paga')
+        if paid:
+            db.session.execute(insert(StatementLine), [{
+                'fingerprint': matched[fee_id]['fingerprint'],
+                'fee_id': fee_id,
+                'posted_date': matched[fee_id]['date'],
+                'amount': matched[fee_id]['amount'],
+                'description': (matched[fee_id]['description'] or '')[:300],
+            } for fee_id in paid])
+            report.paid += len(paid)
+            report.total += sum(matched[fee_id]['amount'] for fee_id in paid)
+        db.session.commit()
+    return report
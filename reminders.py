@@ -0,0 +1,341 @@
+import asyncio
+import importlib
+import json
+import os
+import urllib.request
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from sqlalchemy import select, update, or_, and_, insert as generic_insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, Student, Guardian, Fee, ReminderLog
+from utils import somente_digitos
+
+# --- LEMBRETES DE MENSALIDADE ---
+# Seleciona no banco, em lotes de responsáveis, as mensalidades pendentes que
+# vencem nos próximos dias ou já venceram, monta uma mensagem por responsável
+# e envia tudo em paralelo (asyncio) pelo "sender" configurado, respeitando um
+# limite de mensagens por segundo e tentando de novo em caso de falha.
+#
+# Antes de enviar, cada (mensalidade, tipo, dia) é registrado em ReminderLog
+# com INSERT ... ON CONFLICT: só manda quem conseguiu registrar, então duas
+# execuções ao mesmo tempo (ou repetidas no mesmo dia) não duplicam avisos;
+# registros com falha no envio, ou "pending" há mais de STALE_PENDING_MINUTES
+# (execução que morreu no meio do envio), podem ser pegos de novo.
+# Avisos de vencimento próximo saem uma vez por mensalidade; de atraso, no
+# máximo a cada OVERDUE_EVERY_DAYS dias.
+#
+# Senders: "file" grava as mensagens num arquivo JSON Lines (testes/uso
+# local), "webhook" faz um POST JSON para REMINDER_WEBHOOK_URL (gateway de
+# SMS/WhatsApp). Outro envio: "pacote.modulo:Classe" com um método async send().
+
+BATCH_SIZE = 500
+DAYS_AHEAD = 5
+OVERDUE_EVERY_DAYS = 7
+RATE_PER_SECOND = 20
+CONCURRENCY = 20
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 1.0  # segundos; dobra a cada tentativa
+STALE_PENDING_MINUTES = 30
+
+
+# --- SENDERS ---
+
+class FileSender:
+    def __init__(self, path):
+        self.path = path
+
+    async def send(self, phone, text):
+        # Escrita síncrona, sem await no meio: as linhas não se misturam
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'phone': phone, 'text': text}, ensure_ascii=False) + '\n')
+
+
+class WebhookSender:
+    def __init__(self, url, token=None, timeout=10):
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+
+    def _post(self, payload):
+        request = urllib.request.Request(self.url, data=json.dumps(payload).encode('utf-8'), method='POST')
+        request.add_header('Content-Type', 'application/json')
+        if self.token:
+            request.add_header('Authorization', f'Bearer {self.token}')
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            if response.status >= 300:
+                raise RuntimeError(f'HTTP {response.status}')
+
+    async def send(self, phone, text):
+        # urllib é bloqueante: roda numa thread para não travar o loop
+        await asyncio.to_thread(self._post, {'phone': phone, 'text': text})
+
+
+def get_sender(config):
+    name = config.get('REMINDER_SENDER') or 'file'
+    if name == 'file':
+        os.makedirs(os.path.dirname(config['REMINDER_FILE']) or '.', exist_ok=True)
+        return FileSender(config['REMINDER_FILE'])
+    if name == 'webhook':
+        return WebhookSender(config['REMINDER_WEBHOOK_URL'], config.get('REMINDER_WEBHOOK_TOKEN'))
+    module, _, cls = name.partition(':')
+    return getattr(importlib.import_module(module), cls)(config)
+
+
+# --- SELEÇÃO E MENSAGENS ---
+
+@dataclass
+class Message:
+    guardian_id: int
+    guardian_name: str
+    phone: str
+    fees: list = field(default_factory=list)  # (fee_id, tipo, (aluno, mês, ano, valor, vencimento))
+    text: str = ''
+
+
+def normalize_phone(phone):
+    digits = somente_digitos(phone)
+    if len(digits) in (10, 11):  # DDD + número
+        digits = '55' + digits
+    return digits if len(digits) >= 12 else None
+
+
+def reminder_kind(due_date, today):
+    return 'overdue' if due_date < today else 'upcoming'
+
+
+def fee_line(student, month, year, amount, due_date, verb):
+    value = f'{amount:,.2f}'.replace(',', '_').replace('.', ',').replace('_', '.')  # 1.234,56
+    return f'- {student} ({month}/{year}): R$ {value} - {verb} em {due_date.strftime("%d/%m/%Y")}'
+
+
+def render_message(guardian_name, fees, today):
+    # fees: (aluno, mês, ano, valor, vencimento)
+    first_name = guardian_name.split()[0] if guardian_name else ''
+    lines = [f'Olá, {first_name}! Aqui é da escola.']
+    overdue = [f for f in fees if f[4] < today]
+    upcoming = [f for f in fees if f[4] >= today]
+    if overdue:
+        lines.append('Mensalidades em atraso:')
+        lines += [fee_line(*f, 'venceu') for f in overdue]
+    if upcoming:
+        lines.append('Próximos vencimentos:')
+        lines += [fee_line(*f, 'vence') for f in upcoming]
+    lines.append('Se já pagou, por favor desconsidere esta mensagem.')
+    return '\n'.join(lines)
+
+
+def guardian_batches(today, days_ahead, batch_size=BATCH_SIZE):
+    # Keyset por responsável: cada lote é uma consulta curta, sem cursor aberto
+    # entre os commits dos lotes
+    limit_date = today + timedelta(days=days_ahead)
+    due = [Fee.status == 'pendente', Fee.due_date.isnot(None), Fee.due_date <= limit_date]
+    last_id = 0
+    while True:
+        ids = db.session.scalars(
+            select(Guardian.id).distinct()
+            .join(Student, Student.guardian_id == Guardian.id)
+            .join(Fee, Fee.student_id == Student.id)
+            .where(Guardian.id > last_id, *due)
+            .order_by(Guardian.id).limit(batch_size)
+        ).all()
+        if not ids:
+            return
+        last_id = ids[-1]
+        yield db.session.query(
+            Guardian.id, Guardian.name, Guardian.phone,
+            Student.name, Fee.id, Fee.month, Fee.year, Fee.amount, Fee.due_date
+        ).join(Student, Student.guardian_id == Guardian.id) \
+         .join(Fee, Fee.student_id == Student.id) \
+         .filter(Guardian.id.in_(ids), *due) \
+         .order_by(Guardian.id, Fee.due_date, Fee.id).all()
+
+
+def recently_sent(fee_ids, today):
+    # (fee_id, tipo) já avisados: vencimento próximo uma vez, atraso a cada N dias.
+    # "pending" não conta: em andamento é claim quem barra; travado, pode sair de novo
+    rows = db.session.query(ReminderLog.fee_id, ReminderLog.kind, ReminderLog.sent_on) \
+        .filter(ReminderLog.fee_id.in_(fee_ids), ReminderLog.status == 'sent')
+    overdue_since = today - timedelta(days=OVERDUE_EVERY_DAYS)
+    return {(fee_id, kind) for fee_id, kind, sent_on in rows
+            if kind == 'upcoming' or sent_on > overdue_since}
+
+
+def build_messages(rows, today, report):
+    skip = recently_sent([row[4] for row in rows], today)
+    by_guardian = {}
+    for g_id, g_name, phone, s_name, fee_id, month, year, amount, due_date in rows:
+        kind = reminder_kind(due_date, today)
+        if (fee_id, kind) in skip:
+            report.deduped += 1
+            continue
+        entry = by_guardian.setdefault(g_id, (g_name, phone, []))
+        entry[2].append((fee_id, kind, (s_name, month, year, amount, due_date)))
+
+    messages = []
+    for g_id, (g_name, phone, fees) in by_guardian.items():
+        number = normalize_phone(phone)
+        if not number:
+            report.no_phone += 1
+            continue
+        messages.append(Message(guardian_id=g_id, guardian_name=g_name, phone=number, fees=fees))
+    return messages
+
+
+# --- REGISTRO (DEDUPLICAÇÃO) ---
+
+def _log_insert(now):
+    dialect = db.engine.dialect.name
+    keys = ['fee_id', 'kind', 'sent_on']
+    if dialect in ('postgresql', 'sqlite'):
+        stmt = (pg_insert if dialect == 'postgresql' else sqlite_insert)(ReminderLog)
+        stale = now - timedelta(minutes=STALE_PENDING_MINUTES)
+        return stmt.on_conflict_do_update(
+            index_elements=keys,
+            set_={'status': 'pending', 'error': None, 'attempts': 0, 'claimed_at': now},
+            where=or_(
+                ReminderLog.status == 'failed',
+                and_(ReminderLog.status == 'pending',
+                     or_(ReminderLog.claimed_at.is_(None), ReminderLog.claimed_at < stale)),
+            ),
+        )
+    return generic_insert(ReminderLog)
+
+
+def claim(messages, today):
+    # Registra como "pending"; devolve só as mensagens que conseguimos registrar,
+    # com o texto montado apenas com as mensalidades registradas
+    if not messages:
+        return []
+    now = datetime.now()
+    claimed = set(db.session.execute(
+        _log_insert(now).returning(ReminderLog.fee_id, ReminderLog.kind),
+        [{'fee_id': fee_id, 'kind': kind, 'guardian_id': m.guardian_id, 'sent_on': today,
+          'status': 'pending', 'claimed_at': now}
+         for m in messages for fee_id, kind, _ in m.fees]
+    ).all())
+    db.session.commit()
+    result = []
+    for m in messages:
+        m.fees = [f for f in m.fees if f[:2] in claimed]
+        if m.fees:
+            m.text = render_message(m.guardian_name, [data for _, _, data in m.fees], today)
+            result.append(m)
+    return result
+
+
+def record_results(results, today):
+    # Um UPDATE por resultado distinto (quase sempre só "sent" na 1ª tentativa)
+    groups = {}
+    for message, status, attempts, error in results:
+        groups.setdefault((status, attempts, error), []).extend(fee_id for fee_id, _, _ in message.fees)
+    for (status, attempts, error), fee_ids in groups.items():
+        db.session.execute(
+            update(ReminderLog)
+            .where(ReminderLog.fee_id.in_(fee_ids), ReminderLog.sent_on == today, ReminderLog.status == 'pending')
+            .values(status=status, attempts=attempts, error=error[:300] if error else None)
+            .execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+
+
+# --- ENVIO ---
+
+class RateLimiter:
+    # No máximo "rate" envios por segundo, espaçados igualmente
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_slot = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self.lock:
+            now = asyncio.get_running_loop().time()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        await asyncio.sleep(slot - now)
+
+
+async def send_one(sender, message, limiter, semaphore, attempts, retry_delay):
+    async with semaphore:
+        error = None
+        for attempt in range(1, attempts + 1):
+            await limiter.wait()
+            try:
+                await sender.send(message.phone, message.text)
+                return message, 'sent', attempt, None
+            except Exception as e:
+                error = f'{e.__class__.__name__}: {e}'
+                if attempt < attempts:
+                    await asyncio.sleep(retry_delay * 2 ** (attempt - 1))
+        return message, 'failed', attempts, error
+
+
+async def dispatch(sender, messages, rate=RATE_PER_SECOND, concurrency=CONCURRENCY,
+                   attempts=MAX_ATTEMPTS, retry_delay=RETRY_DELAY):
+    limiter = RateLimiter(rate)
+    semaphore = asyncio.Semaphore(concurrency)
+    return await asyncio.gather(*(
+        send_one(sender, m, limiter, semaphore, attempts, retry_delay) for m in messages
+    ))
+
+
+class ReminderReport:
+    def __init__(self):
+        self.messages = 0
+        self.sent = 0
+        self.failed = 0
+        self.deduped = 0
+        self.no_phone = 0
+        self.errors = []  # (responsável, erro)
+
+    def as_dict(self):
+        return dict(vars(self), errors=self.errors[:100])
+
+
+def send_reminders(config, today=None, days_ahead=DAYS_AHEAD, dry_run=False):
+    today = today or date.today()
+    report = ReminderReport()
+    sender = None if dry_run else get_sender(config)
+    options = {
+        'rate': config.get('REMINDER_RATE', RATE_PER_SECOND),
+        'concurrency': config.get('REMINDER_CONCURRENCY', CONCURRENCY),
+    }
+
+    for rows in guardian_batches(today, days_ahead):
+        messages = build_messages(rows, today, report)
+        if dry_run:
+            report.messages += len(messages)
+            continue
+        messages = claim(messages, today)
+        report.messages += len(messages)
+        # O banco fica livre enquanto o lote é enviado
+        results = asyncio.run(dispatch(sender, messages, **options))
+        record_results(results, today)
+        for m, status, _, error in results:
+            if status == 'sent':
+                report.sent += 1
+            else:
+                report.failed += 1
+                report.errors.append((m.guardian_id, error))
+    return report
+
+
+def run_reminders_job(output_path, days_ahead):
+    # Executa no processo do pool de jobs (ver jobs.py): cria o próprio app
+    from app import app
+
+    with app.app_context():
+        report = send_reminders(app.config, days_ahead=days_ahead)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report.as_dict(), f, ensure_ascii=False, indent=2)
+
+
+def init_reminders(app):
+    app.config.setdefault('REMINDER_SENDER', os.environ.get('REMINDER_SENDER', 'file'))
+    app.config.setdefault('REMINDER_FILE', os.path.join(app.instance_path, 'reminders.jsonl'))
+    app.config.setdefault('REMINDER_WEBHOOK_URL', os.environ.get('REMINDER_WEBHOOK_URL'))
+    app.config.setdefault('REMINDER_WEBHOOK_TOKEN', os.environ.get('REMINDER_WEBHOOK_TOKEN'))
+    app.config.setdefault('REMINDER_RATE', float(os.environ.get('REMINDER_RATE', RATE_PER_SECOND)))
+    app.config.setdefault('REMINDER_CONCURRENCY', int(os.environ.get('REMINDER_CONCURRENCY', CONCURRENCY)))
@@ -0,0 +1,88 @@
+from sqlalchemy import select, delete, insert, func
+
+from models import db, Student, Fee, FeeRollup
+
+# --- RESUMO FINANCEIRO (FeeRollup) ---
+# Quantidade e soma das mensalidades por ano, mês, turma e status. O
+# dashboard e os relatórios anuais leem essas poucas centenas de linhas em
+# vez de varrer Fee inteira.
+#
+# Toda rota que grava mensalidades chama refresh_rollup() para o pedaço
+# afetado (ex.: um mês/ano, uma turma) antes do commit, na mesma transação:
+# as linhas do pedaço são apagadas e recalculadas a partir de Fee. Recalcular
+# em vez de somar diferenças deixa o resumo certo também depois de INSERTs em
+# massa (geração mensal/anual), em que não sabemos quais linhas já existiam.
+# rebuild_rollup() (comando "flask rebuild-rollup") refaz tudo.
+#
+# Concorrência (PostgreSQL): duas transações recalculando o mesmo pedaço não
+# enxergam o DELETE uma da outra e as duas inseririam as mesmas chaves. Antes
+# de recalcular, cada uma pega um advisory lock do pedaço (liberado no
+# commit/rollback); a segunda espera a primeira terminar e já lê as
+# mensalidades dela. Recálculos com alguma dimensão "ALL" pegam o lock geral
+# exclusivo; pedaços exatos pegam o geral compartilhado + o do pedaço.
+# No SQLite as escritas já são serializadas pelo próprio banco.
+
+ALL = object()  # sem filtro nesta dimensão
+ROLLUP_LOCK = 0x526f6c6c  # chave do lock geral do resumo
+
+
+def _slice(year, month, class_id):
+    fee_conditions = []
+    rollup_conditions = []
+    if year is not ALL:
+        fee_conditions.append(Fee.year == year if year else Fee.year.is_(None))
+        rollup_conditions.append(FeeRollup.year == (year or 0))
+    if month is not ALL:
+        fee_conditions.append(Fee.month == month)
+        rollup_conditions.append(FeeRollup.month == month)
+    if class_id is not ALL:
+        fee_conditions.append(Student.class_id == class_id if class_id else Student.class_id.is_(None))
+        rollup_conditions.append(FeeRollup.class_id == (class_id or 0))
+    return fee_conditions, rollup_conditions
+
+
+def _lock_slice(year, month, class_id):
+    if db.engine.dialect.name != 'postgresql':
+        return
+    if ALL in (year, month, class_id):
+        db.session.execute(select(func.pg_advisory_xact_lock(ROLLUP_LOCK)))
+        return
+    db.session.execute(select(func.pg_advisory_xact_lock_shared(ROLLUP_LOCK)))
+    db.session.execute(select(func.pg_advisory_xact_lock(
+        ROLLUP_LOCK, func.hashtext(f'{year or 0}|{month}|{class_id or 0}')
+    )))
+
+
+def refresh_rollup(year=ALL, month=ALL, class_id=ALL):
+    # Não faz commit: roda na mesma transação da alteração das mensalidades
+    _lock_slice(year, month, class_id)
+    fee_conditions, rollup_conditions = _slice(year, month, class_id)
+    db.session.execute(delete(FeeRollup).where(*rollup_conditions))
+
+    key = (
+        func.coalesce(Fee.year, 0),
+        Fee.month,
+        func.coalesce(Student.class_id, 0),
+        func.coalesce(Fee.status, 'pendente'),
+    )
+    source = select(*key, func.count(Fee.id), func.sum(Fee.amount)) \
+        .join(Student, Fee.student_id == Student.id) \
+        .where(*fee_conditions) \
+        .group_by(*key)
+    db.session.execute(
+        insert(FeeRollup).from_select(['year', 'month', 'class_id', 'status', 'count', 'total'], source)
+    )
+
+
+def refresh_fee(fee):
+    # Pedaço de uma mensalidade só (cadastro, pagamento, edição)
+    refresh_rollup(fee.year, fee.month, fee.student.class_id)
+
+
+def rebuild_rollup():
+    refresh_rollup()
+    db.session.commit()
+
+
+def rollup_is_empty():
+    return FeeRollup.query.first() is None and Fee.query.first() is not None
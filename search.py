@@ -0,0 +1,179 @@
+from sqlalchemy import text, insert, and_
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Student, Guardian, Class, SearchEntry
+from utils import normalizar, somente_digitos
+
+# --- BUSCA DE ALUNOS E RESPONSÁVEIS ---
+# Cada aluno e cada responsável tem uma linha em SearchEntry com o texto já
+# normalizado em Python (sem acentos, como o remover_acentos dos recibos).
+# O banco acelera a busca nessa tabela:
+#   - SQLite: tabela FTS5 "search_fts" (conteúdo externo) mantida por triggers
+#   - PostgreSQL: índice GIN de trigramas (pg_trgm) em body
+#   - sem nenhum dos dois: LIKE simples (funciona, só não usa índice)
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+BATCH_SIZE = 1000
+
+SQLITE_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5("
+    "body, content='search_entry', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS search_entry_ai AFTER INSERT ON search_entry BEGIN "
+    "INSERT INTO search_fts(rowid, body) VALUES (new.id, new.body); END",
+    "CREATE TRIGGER IF NOT EXISTS search_entry_ad AFTER DELETE ON search_entry BEGIN "
+    "INSERT INTO search_fts(search_fts, rowid, body) VALUES ('delete', old.id, old.body); END",
+    "CREATE TRIGGER IF NOT EXISTS search_entry_au AFTER UPDATE ON search_entry BEGIN "
+    "INSERT INTO search_fts(search_fts, rowid, body) VALUES ('delete', old.id, old.body); "
+    "INSERT INTO search_fts(rowid, body) VALUES (new.id, new.body); END",
+]
+
+POSTGRES_TRGM_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_search_entry_body_trgm ON search_entry USING gin (body gin_trgm_ops)",
+]
+
+_backend = None
+
+
+def detect_search_backend():
+    # Nos workers: só descobre o que o init-db já criou, sem DDL
+    global _backend
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        found = db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_fts'")).first()
+        _backend = 'fts5' if found else 'like'
+    elif dialect == 'postgresql':
+        found = db.session.execute(text(
+            "SELECT 1 FROM pg_indexes WHERE indexname = 'ix_search_entry_body_trgm'")).first()
+        _backend = 'trgm' if found else 'like'
+    else:
+        _backend = 'like'
+    return _backend
+
+
+def setup_search_backend():
+    # Chamado pelo init-db (migrations.py). Se o banco não suportar, fica no LIKE.
+    global _backend
+    dialect = db.engine.dialect.name
+    ddl = {'sqlite': SQLITE_FTS_DDL, 'postgresql': POSTGRES_TRGM_DDL}.get(dialect)
+    _backend = 'like'
+    if not ddl:
+        return _backend
+    try:
+        with db.engine.begin() as conn:
+            for statement in ddl:
+                conn.execute(text(statement))
+        _backend = 'fts5' if dialect == 'sqlite' else 'trgm'
+    except SQLAlchemyError as e:
+        print(f'Busca: índice do banco indisponível, usando LIKE ({e.__class__.__name__})')
+    return _backend
+
+
+# --- MANUTENÇÃO DO ÍNDICE ---
+
+def student_entry(student_id, name, class_name, class_year, guardian_name, cpf, phone):
+    label = f'{name} ({class_name} {class_year})' if class_name else name
+    body = ' '.join([normalizar(name), normalizar(class_name), normalizar(guardian_name),
+                     somente_digitos(cpf), somente_digitos(phone)])
+    return {'kind': 'student', 'ref_id': student_id, 'label': label, 'body': body.strip()}
+
+
+def guardian_entry(guardian_id, name, cpf, phone):
+    label = f'{name} - CPF {cpf}' if cpf else name
+    body = ' '.join([normalizar(name), somente_digitos(cpf), somente_digitos(phone)])
+    return {'kind': 'guardian', 'ref_id': guardian_id, 'label': label, 'body': body.strip()}
+
+
+def _student_rows():
+    return db.session.query(
+        Student.id, Student.name, Class.name, Class.year, Guardian.name, Guardian.cpf, Guardian.phone
+    ).outerjoin(Class, Student.class_id == Class.id) \
+     .outerjoin(Guardian, Student.guardian_id == Guardian.id)
+
+
+def _guardian_rows():
+    return db.session.query(Guardian.id, Guardian.name, Guardian.cpf, Guardian.phone)
+
+
+def _insert_entries(entries):
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) == BATCH_SIZE:
+            db.session.execute(insert(SearchEntry), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(SearchEntry), batch)
+
+
+def remove_from_index(kind, ids):
+    if ids:
+        SearchEntry.query.filter(SearchEntry.kind == kind, SearchEntry.ref_id.in_(ids)) \
+            .delete(synchronize_session=False)
+
+
+def index_students(ids):
+    # Não faz commit: roda na mesma transação da alteração do aluno
+    remove_from_index('student', ids)
+    _insert_entries(student_entry(*row) for row in _student_rows().filter(Student.id.in_(ids)))
+
+
+def index_guardians(ids):
+    remove_from_index('guardian', ids)
+    _insert_entries(guardian_entry(*row) for row in _guardian_rows().filter(Guardian.id.in_(ids)))
+
+
+def rebuild_search_index():
+    SearchEntry.query.delete(synchronize_session=False)
+    _insert_entries(student_entry(*row) for row in _student_rows().yield_per(BATCH_SIZE))
+    _insert_entries(guardian_entry(*row) for row in _guardian_rows().yield_per(BATCH_SIZE))
+    db.session.commit()
+
+
+def index_is_empty():
+    return SearchEntry.query.first() is None and Student.query.first() is not None
+
+
+# --- CONSULTA ---
+
+def query_tokens(q):
+    tokens = []
+    for raw in (q or '').split():
+        token = normalizar(raw)
+        if not any(c.isalpha() for c in token):
+            token = somente_digitos(token)  # "123.456.789-00" -> "12345678900"
+        token = ''.join(c for c in token if c.isalnum())
+        if token:
+            tokens.append(token)
+    return tokens
+
+
+def search(q, kind=None, limit=DEFAULT_LIMIT):
+    tokens = query_tokens(q)
+    if not tokens:
+        return []
+    limit = max(1, min(limit or DEFAULT_LIMIT, MAX_LIMIT))
+    backend = _backend or detect_search_backend()
+
+    if backend == 'fts5':
+        # Cada termo vira prefixo: "joa" encontra "joao"
+        match = ' '.join(f'"{t}"*' for t in tokens)
+        sql = ("SELECT e.kind, e.ref_id, e.label FROM search_fts "
+               "JOIN search_entry e ON e.id = search_fts.rowid "
+               "WHERE search_fts MATCH :match" + (" AND e.kind = :kind" if kind else "") +
+               " ORDER BY search_fts.rank LIMIT :limit")
+        rows = db.session.execute(text(sql), {'match': match, 'kind': kind, 'limit': limit})
+    else:
+        query = db.session.query(SearchEntry.kind, SearchEntry.ref_id, SearchEntry.label) \
+            .filter(and_(*[SearchEntry.body.like(f'%{t}%') for t in tokens]))
+        if kind:
+            query = query.filter(SearchEntry.kind == kind)
+        if backend == 'trgm':
+            query = query.order_by(db.func.similarity(SearchEntry.body, ' '.join(tokens)).desc())
+        else:
+            query = query.order_by(SearchEntry.label)
+        rows = query.limit(limit)
+
+    return [{'kind': k, 'id': ref_id, 'label': label} for k, ref_id, label in rows]
@@ -0,0 +1,51 @@
+// Campo de busca com sugestões (datalist) ligado a /api/search.
+// O texto digitado fica no input visível; o id escolhido vai para o campo oculto.
+function typeahead(inputId, hiddenId, kind, url) {
+    var input = document.getElementById(inputId);
+    var hidden = document.getElementById(hiddenId);
+    var list = document.createElement('datalist');
+    var results = [];
+    var timer = null;
+
+    list.id = inputId + 'Options';
+    input.setAttribute('list', list.id);
+    input.setAttribute('autocomplete', 'off');
+    input.after(list);
+
+    input.addEventListener('input', function () {
+        var escolhido = results.find(function (r) { return r.label === input.value; });
+        hidden.value = escolhido ? escolhido.id : '';
+        if (escolhido || input.value.length < 2) return;
+
+        // Espera o usuário parar de digitar antes de consultar
+        clearTimeout(timer);
+        timer = setTimeout(function () {
+            fetch(url + '?kind=' + kind + '&q=' + encodeURIComponent(input.value))
+                .then(function (r) { return r.json(); })
+                .then(function (data) {
+                    results = data.results;
+                    list.innerHTML = '';
+                    results.forEach(function (r) {
+                        var option = document.createElement('option');
+                        option.value = r.label;
+                        list.appendChild(option);
+                    });
+                });
+        }, 200);
+    });
+
+    // Não deixa enviar com texto que não corresponde a nenhuma sugestão
+    input.form.addEventListener('submit', function (e) {
+        if (input.required && !hidden.value) {
+            e.preventDefault();
+            input.setCustomValidity('Escolha uma opção da lista.');
+            input.reportValidity();
+            input.setCustomValidity('');
+        }
+    });
+}
+
+function limparTypeahead(inputId, hiddenId) {
+    document.getElementById(inputId).value = '';
+    document.getElementById(hiddenId).value = '';
+}
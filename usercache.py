@@ -0,0 +1,93 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from flask_login import UserMixin
+from sqlalchemy import event
+
+from models import db, User
+
+# --- CACHE DE USUÁRIOS LOGADOS ---
+# O user_loader do Flask-Login roda em toda requisição. Guardamos aqui uma
+# cópia simples (id, username, role) de cada usuário por alguns segundos, e
+# assim a maioria das requisições não precisa ir ao banco para montar o
+# current_user. Qualquer UPDATE/DELETE em User (troca de papel ou de senha)
+# remove a entrada na hora; o TTL limita o atraso entre workers diferentes.
+
+USER_CACHE_TTL = 60
+USER_CACHE_SIZE = 1000
+
+
+class CachedUser(UserMixin):
+    # Não é um objeto do SQLAlchemy: pode ser usado depois do fim da sessão
+    def __init__(self, id, username, role):
+        self.id = id
+        self.username = username
+        self.role = role
+
+
+class UserCache:
+    def __init__(self, ttl=USER_CACHE_TTL, size=USER_CACHE_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self.entries = OrderedDict()  # id -> (expira_em, CachedUser)
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry and entry[0] > now:
+                self.entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        row = db.session.query(User.id, User.username, User.role).filter(User.id == user_id).first()
+        if row is None:
+            return None
+        user = CachedUser(*row)
+        if self.ttl <= 0:
+            return user
+
+        with self.lock:
+            self.entries[user_id] = (now + self.ttl, user)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_changed_user(mapper, connection, target):
+    user_cache.invalidate(target.id)
+
+
+def init_user_cache(app):
+    user_cache.ttl = app.config.get('USER_CACHE_TTL', USER_CACHE_TTL)
+    user_cache.size = app.config.get('USER_CACHE_SIZE', USER_CACHE_SIZE)
+
+
+def render_user_cache_metrics():
+    with user_cache.lock:
+        return (
+            '# TYPE eduaxis_user_cache_hits_total counter\n'
+            f'eduaxis_user_cache_hits_total {user_cache.hits}\n'
+            '# TYPE eduaxis_user_cache_misses_total counter\n'
+            f'eduaxis_user_cache_misses_total {user_cache.misses}\n'
+            '# TYPE eduaxis_user_cache_entries gauge\n'
+            f'eduaxis_user_cache_entries {len(user_cache.entries)}\n'
+        )
@@ -0,0 +1,28 @@
+import unicodedata
+from datetime import datetime
+
+
+def remover_acentos(txt):
+    # Ex.: "João" -> "Joao" (fontes do FPDF, buscas e comparações de nomes)
+    if not txt: return ""
+    try:
+        return unicodedata.normalize('NFKD', txt).encode('ASCII', 'ignore').decode('ASCII')
+    except:
+        return txt
+
+
+def normalizar(txt):
+    # Chave de comparação: sem acentos, minúsculas e espaços simples
+    return ' '.join(remover_acentos(txt).lower().split())
+
+
+def somente_digitos(txt):
+    return ''.join(c for c in (txt or '') if c.isdigit())
+
+
+def data_formulario(txt):
+    # Campo <input type="date"> (AAAA-MM-DD); None se vier vazio ou inválido
+    try:
+        return datetime.strptime(txt, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None